@@ -0,0 +1,185 @@
+"""
+Benchmarks of the Database and the BotPersistence methods on synthetic datasets of several sizes.
+Every method is called several times and its latency and throughput are reported as a table
+and, if $--output is passed, as JSON, so the results of two commits can be compared.
+It must be run from the bot directory against a throwaway database, since it rewrites the tables:
+
+    PG_HOST=... PG_PORT=... PG_NAME=... PG_USER=... PG_PASS=... python3 -m benchmarks.suite --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from database.db import Database
+from tiktokinformerbot.persistence import BotPersistence
+
+SIZES = (1000, 100000, 1000000)
+REPEATS = 20
+# Count of rows changed by one call of the writing methods
+BATCH = 100
+# Count of subscriptions of every chat and count of chats per a tiktoker
+SUBSCRIPTIONS = 3
+CHATS_PER_TIKTOKER = 10
+
+
+def seed(database: Database, size: int):
+    """
+    Fills the tables with $size chats and users, $size / $CHATS_PER_TIKTOKER tiktokers
+    and $SUBSCRIPTIONS subscriptions of every chat. The rows are generated by the server.
+    """
+    tiktokers = max(size // CHATS_PER_TIKTOKER, 1)
+    with database.transaction() as cur:
+        cur.execute("TRUNCATE conversations, chats, bot_users, favourite_users, favourite_users_changes, "
+                    "users, tiktoks CASCADE")
+        # The log of changes isn't a part of the seeding
+        cur.execute("ALTER TABLE favourite_users DISABLE TRIGGER favourite_users_changes")
+
+        cur.execute("INSERT INTO conversations (chat_id, main_menu_state) "
+                    "SELECT id, 0 FROM generate_series(1, %(size)s) AS id", {'size': size})
+        cur.execute("INSERT INTO chats (chat_id, title) "
+                    "SELECT id, 'chat ' || id FROM generate_series(1, %(size)s) AS id", {'size': size})
+        cur.execute("INSERT INTO bot_users (user_id, chat_id, username, first_name) "
+                    "SELECT id, id, 'user' || id, 'name ' || id FROM generate_series(1, %(size)s) AS id",
+                    {'size': size})
+        cur.execute("INSERT INTO users (unique_id, nickname, followers_cnt, following_cnt, heart_cnt, video_cnt) "
+                    "SELECT 'tiktoker' || id, 'nickname ' || id, id, id, id, id "
+                    "FROM generate_series(0, %(tiktokers)s - 1) AS id", {'tiktokers': tiktokers})
+        cur.execute("INSERT INTO favourite_users (unique_id, chat_id) "
+                    "SELECT DISTINCT 'tiktoker' || ((chat_id * 7 + k * 13) %% %(tiktokers)s), chat_id "
+                    "FROM generate_series(1, %(size)s) AS chat_id, generate_series(0, %(subscriptions)s - 1) AS k",
+                    {'size': size, 'tiktokers': tiktokers, 'subscriptions': SUBSCRIPTIONS})
+
+        cur.execute("ALTER TABLE favourite_users ENABLE TRIGGER favourite_users_changes")
+
+    with database.transaction() as cur:
+        cur.execute("ANALYZE")
+
+
+def measure(method, repeats: int, rows: int = 1) -> dict:
+    """
+    Calls $method $repeats times and returns statistics of its latency in seconds
+    and its throughput in rows per second.
+
+    :param rows: count of rows processed by one call
+    """
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        method()
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return {'calls': repeats,
+            'rows': rows,
+            'min': timings[0],
+            'median': statistics.median(timings),
+            'p95': timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+            'mean': statistics.mean(timings),
+            'throughput': rows / statistics.mean(timings)}
+
+
+def benchmark(database: Database, size: int, repeats: int) -> dict:
+    """
+    Runs every benchmark on the seeded dataset of $size chats.
+
+    :return: dictionary of names of the methods and their statistics
+    """
+    tiktokers = max(size // CHATS_PER_TIKTOKER, 1)
+    results = {}
+
+    def changed_chats():
+        return {chat_id: {'title': f'changed {chat_id} {time.monotonic()}', 'description': None, 'photo': None}
+                for chat_id in random.sample(range(1, size + 1), min(BATCH, size))}
+
+    results['Database.update_data'] = measure(lambda: database.update_data('chats', changed_chats()),
+                                              repeats, rows=min(BATCH, size))
+    # Reading of a whole table is slow on large datasets, so it's repeated fewer times
+    results['Database.get_data'] = measure(lambda: database.get_data('chats'), max(repeats // 10, 1), rows=size)
+    results['Database.get_row'] = measure(lambda: database.get_row('chats', random.randint(1, size)), repeats)
+
+    tiktok_ids = iter(range(1, repeats + 1))
+    results['Database.add_tiktok'] = measure(
+        lambda: database.add_tiktok(SimpleNamespace(id=next(tiktok_ids),
+                                                    user_id=f'tiktoker{random.randrange(tiktokers)}',
+                                                    desc='benchmark', time=datetime.now())),
+        repeats)
+    results['Database.get_chats_favourite_users'] = measure(
+        lambda: database.get_chats_favourite_users(f'tiktoker{random.randrange(tiktokers)}'), repeats)
+
+    # Changes are only collected in memory, the writing is measured separately
+    persistence = BotPersistence(database, store_bot_data=False, on_flush=True)
+    results['BotPersistence.update_chat_data'] = measure(
+        lambda: persistence.update_chat_data(random.randint(1, size), {'title': f'chat {time.monotonic()}'}),
+        repeats)
+
+    def write_batch():
+        for chat_id, data in changed_chats().items():
+            persistence.update_chat_data(chat_id, data)
+        persistence._write()
+
+    # The chats changed by the previous benchmark are written before the measurement
+    persistence._write()
+    results['BotPersistence.write'] = measure(write_batch, repeats, rows=min(BATCH, size))
+
+    chat_data = persistence.get_chat_data()
+    results['BotPersistence.get_chat_data'] = measure(lambda: chat_data[random.randint(1, size)], repeats)
+    return results
+
+
+def get_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the Database and the BotPersistence methods')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='counts of the seeded chats')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='count of calls of every method')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random ids')
+    parser.add_argument('--output', help='path of the JSON file with the results')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    database = Database.connect(host=os.getenv('PG_HOST'), port=os.getenv('PG_PORT'),
+                                user=os.getenv('PG_USER'), password=os.getenv('PG_PASS'),
+                                database=os.getenv('PG_NAME'))
+    with database.transaction() as cur:
+        cur.execute("SHOW server_version")
+        server_version = cur.fetchone()[0]
+
+    report = {'revision': get_revision(),
+              'started': datetime.now().isoformat(),
+              'python': platform.python_version(),
+              'postgres': server_version,
+              'repeats': args.repeats,
+              'batch': BATCH,
+              'results': []}
+
+    print(f"{'size':>8} {'method':<36} {'median, ms':>11} {'p95, ms':>9} {'rows/s':>12}")
+    for size in args.sizes:
+        started = time.perf_counter()
+        seed(database, size)
+        seeding = time.perf_counter() - started
+
+        for method, result in benchmark(database, size, args.repeats).items():
+            report['results'].append(dict(size=size, method=method, seeding=seeding, **result))
+            print(f"{size:>8} {method:<36} {result['median'] * 1e3:>11.3f} {result['p95'] * 1e3:>9.3f} "
+                  f"{result['throughput']:>12.0f}")
+
+    database.close()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
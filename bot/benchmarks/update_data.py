@@ -0,0 +1,48 @@
+"""
+Benchmark of Database.update_data showing how the time of persisting the chats grows with their count.
+It must be run from the bot directory against a throwaway database, since it rewrites the tables:
+
+    PG_HOST=... PG_PORT=... PG_NAME=... PG_USER=... PG_PASS=... python3 -m benchmarks.update_data
+"""
+import os
+import time
+from database.db import Database
+
+COUNTS = (100, 1000, 10000, 100000)
+REPEATS = 3
+
+
+def make_chats(count: int) -> dict:
+    """
+    Creates synthetic chat_data of $count chats.
+    """
+    return {chat_id: {'title': f'chat {chat_id}', 'description': None, 'photo': None}
+            for chat_id in range(1, count + 1)}
+
+
+def main():
+    database = Database.connect(host=os.getenv('PG_HOST'), port=os.getenv('PG_PORT'),
+                                user=os.getenv('PG_USER'), password=os.getenv('PG_PASS'),
+                                database=os.getenv('PG_NAME'))
+
+    print(f"{'chats':>8} {'total, s':>10} {'per chat, us':>14}")
+    for count in COUNTS:
+        chats = make_chats(count)
+        with database.transaction() as cur:
+            cur.execute("TRUNCATE conversations CASCADE")
+        database.update_data('conversations', {chat_id: {'main_menu_state': 0} for chat_id in chats})
+
+        timings = []
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            database.update_chat_data(chats)
+            timings.append(time.perf_counter() - started)
+
+        best = min(timings)
+        print(f"{count:>8} {best:>10.3f} {best / count * 1e6:>14.1f}")
+
+    database.close()
+
+
+if __name__ == '__main__':
+    main()
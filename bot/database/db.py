@@ -1,42 +1,95 @@
 import psycopg2
 import logging
+import threading
+import time
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values
+from contextlib import contextmanager
+from functools import wraps
 from collections import defaultdict
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 
 logging.basicConfig(format='[%(asctime)s]: %(message)s\n',
                     level=logging.WARNING)
 
 
+def reconnecting(method):
+    """
+    Decorator repeating a method of the database if the connection was lost while the method was performed.
+    Each next attempt is made after a twice longer delay.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(self.reconnect_attempts - 1):
+            try:
+                return method(self, *args, **kwargs)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                logging.warning(f"Connection to the database was lost, it will be restored: {e}")
+                time.sleep(self.reconnect_delay * 2 ** attempt)
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class Database:
+    # Count of attempts to connect to the database and the initial delay between them in seconds
+    reconnect_attempts = 5
+    reconnect_delay = 1
+    # Time in seconds after which an idle connection is checked before it's used
+    health_check_interval = 30
+    # Count of rows sent by one multi-row query
+    page_size = 1000
+    # Count of months which partitions of the time series are created ahead for
+    partitions_ahead = 2
+
     def __init__(self):
-        self._connection = None
+        self._credentials = None
+        self._pool = None
+        self._semaphore = None
+        self._last_used = {}
+        # Caches of the names of the columns of the tables and of the queries built by them
+        self._columns = {}
+        self._queries = {}
 
     @staticmethod
     def connect(host: str,
                 port: str,
                 user: str,
                 password: str,
-                database: str):
+                database: str,
+                min_connections: int = 1,
+                max_connections: int = 1):
         """
-        Creates connection to the database using the passed credentials.
+        Creates a pool of connections to the database using the passed credentials.
+        Each call of the database checks out its own connection, so the object may be used by several threads.
 
-        :return: the connection object
+        :param min_connections: count of connections which are kept open
+        :param max_connections: count of connections which may be used at the same time
+        :return: the database object
         """
         db_object = Database()
-        db_object._connection = psycopg2.connect(host=host,
+        db_object._credentials = dict(host=host, port=port, user=user, password=password, database=database)
+        db_object._pool = ThreadedConnectionPool(min_connections,
+                                                 max_connections,
+                                                 host=host,
                                                  port=port,
                                                  user=user,
                                                  password=password,
                                                  database=database)
+        db_object._semaphore = threading.BoundedSemaphore(max_connections)
         db_object._init_tables()
         return db_object
 
+    @reconnecting
     def _init_tables(self):
         """
         Creates tables if it weren't created.
         """
-        with self.connection.cursor() as cur:
+        with self.transaction() as cur:
+            # The bot and the informer create the tables at the same time when they're started
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('init_tables'))")
+
             cur.execute("CREATE TABLE IF NOT EXISTS users ("
                         "unique_id TEXT PRIMARY KEY, "
                         "nickname TEXT NOT NULL, "
@@ -44,16 +97,37 @@ class Database:
                         "following_cnt INTEGER NOT NULL, "
                         "heart_cnt INTEGER NOT NULL, "
                         "video_cnt INTEGER NOT NULL); ")
+
+            # The time of the last update of a user tells how fresh the profile is. The existing rows get
+            # the epoch, since they weren't updated recently, and the new ones get the time of their insertion
+            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS updated TIMESTAMP NOT NULL DEFAULT 'epoch';")
+            cur.execute("ALTER TABLE users ALTER COLUMN updated SET DEFAULT NOW();")
                     
+            # The table created before the partitioning is renamed, and its rows are moved into the new one
+            # by migrate_tiktoks in batches after the start, so the tables aren't locked for the whole copying
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('tiktoks')")
+            row = cur.fetchone()
+            unpartitioned = row is not None and row[0] == 'r'
+            if unpartitioned:
+                cur.execute("ALTER TABLE tiktoks RENAME TO tiktoks_unpartitioned;")
+                cur.execute("ALTER TABLE tiktoks_unpartitioned RENAME CONSTRAINT fk_users TO fk_users_unpartitioned;")
+
+            # Videos are partitioned by months, so the key includes the time
             cur.execute("CREATE TABLE IF NOT EXISTS tiktoks ("
-                        "id BIGINT PRIMARY KEY, "
+                        "id BIGINT NOT NULL, "
                         "user_id TEXT, "
                         "description TEXT NOT NULL, "
                         "time TIMESTAMP NOT NULL, "
+                        "PRIMARY KEY (id, time), "
                         "CONSTRAINT fk_users FOREIGN KEY (user_id) "
                         "REFERENCES users (unique_id) "
                         "ON DELETE CASCADE "
-                        "ON UPDATE CASCADE);")
+                        "ON UPDATE CASCADE) "
+                        "PARTITION BY RANGE (time);")
+            cur.execute("CREATE TABLE IF NOT EXISTS tiktoks_default PARTITION OF tiktoks DEFAULT;")
+            cur.execute("CREATE INDEX IF NOT EXISTS tiktoks_user_id_time ON tiktoks (user_id, time DESC);")
+
+            self._create_partitions(cur, 'tiktoks')
                     
             cur.execute("CREATE TABLE IF NOT EXISTS conversations ("
                         "chat_id INTEGER PRIMARY KEY, "
@@ -78,13 +152,237 @@ class Database:
                         "chat_id INTEGER REFERENCES conversations ON DELETE CASCADE ON UPDATE CASCADE, "
                         "CONSTRAINT favourite_users_pk PRIMARY KEY (unique_id, chat_id));")
 
-        self.connection.commit()
+            # Profiles polled by the informer without subscribers, e.g. the top profiles of TikTok
+            cur.execute("CREATE TABLE IF NOT EXISTS seed_users ("
+                        "unique_id TEXT PRIMARY KEY, "
+                        "added TIMESTAMP NOT NULL DEFAULT NOW());")
 
-    @property
-    def connection(self):
-        if self._connection is None:
+            cur.execute("CREATE TABLE IF NOT EXISTS watermarks ("
+                        "unique_id TEXT PRIMARY KEY, "
+                        "time TIMESTAMP NOT NULL);")
+
+            # Watermarks of the databases created before this table are restored from the tiktoks table once,
+            # or from the table created before the partitioning if it hasn't been migrated yet
+            cur.execute("SELECT to_regclass('tiktoks_unpartitioned') IS NOT NULL")
+            source = 'tiktoks_unpartitioned' if cur.fetchone()[0] else 'tiktoks'
+            cur.execute(sql.SQL("INSERT INTO watermarks (unique_id, time) "
+                                "SELECT user_id, MAX(time) FROM {0} "
+                                "WHERE user_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM watermarks) "
+                                "GROUP BY user_id;").format(sql.Identifier(source)))
+
+            # The log of changes of the favourite users table, which the informer follows instead of reading the table
+            cur.execute("CREATE TABLE IF NOT EXISTS favourite_users_changes ("
+                        "seq BIGSERIAL PRIMARY KEY, "
+                        "unique_id TEXT NOT NULL, "
+                        "chat_id INTEGER NOT NULL, "
+                        "deleted BOOLEAN NOT NULL, "
+                        "created TIMESTAMP NOT NULL DEFAULT NOW());")
+
+            cur.execute("CREATE OR REPLACE FUNCTION log_favourite_users_change() RETURNS TRIGGER AS $$ "
+                        "BEGIN "
+                        "IF TG_OP = 'UPDATE' AND OLD IS NOT DISTINCT FROM NEW THEN "
+                        "RETURN NULL; "
+                        "END IF; "
+                        "IF TG_OP IN ('DELETE', 'UPDATE') THEN "
+                        "INSERT INTO favourite_users_changes (unique_id, chat_id, deleted) "
+                        "VALUES (OLD.unique_id, OLD.chat_id, TRUE); "
+                        "END IF; "
+                        "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+                        "INSERT INTO favourite_users_changes (unique_id, chat_id, deleted) "
+                        "VALUES (NEW.unique_id, NEW.chat_id, FALSE); "
+                        "END IF; "
+                        "PERFORM pg_notify('favourite_users', ''); "
+                        "RETURN NULL; "
+                        "END; "
+                        "$$ LANGUAGE plpgsql;")
+
+            cur.execute("DROP TRIGGER IF EXISTS favourite_users_changes ON favourite_users;")
+            cur.execute("CREATE TRIGGER favourite_users_changes "
+                        "AFTER INSERT OR UPDATE OR DELETE ON favourite_users "
+                        "FOR EACH ROW EXECUTE PROCEDURE log_favourite_users_change();")
+
+            # The history of statistics of users: a row is added only when the statistics change.
+            # The table is partitioned by months, the default partition takes rows which have no partition yet
+            cur.execute("CREATE TABLE IF NOT EXISTS user_stats ("
+                        "unique_id TEXT NOT NULL, "
+                        "time TIMESTAMP NOT NULL, "
+                        "followers_cnt INTEGER NOT NULL, "
+                        "following_cnt INTEGER NOT NULL, "
+                        "heart_cnt BIGINT NOT NULL, "
+                        "video_cnt INTEGER NOT NULL, "
+                        "PRIMARY KEY (unique_id, time)) "
+                        "PARTITION BY RANGE (time);")
+            cur.execute("CREATE TABLE IF NOT EXISTS user_stats_default PARTITION OF user_stats DEFAULT;")
+            self._create_partitions(cur, 'user_stats')
+
+            # The time until which the statistics were downsampled to each resolution
+            cur.execute("CREATE TABLE IF NOT EXISTS user_stats_rollups ("
+                        "resolution TEXT PRIMARY KEY, "
+                        "time TIMESTAMP NOT NULL);")
+
+    @reconnecting
+    def create_partitions(self, since=None):
+        """
+        Creates monthly partitions of the time series tables for $partitions_ahead months ahead.
+
+        :param since: datetime from which month the partitions are created, the current month if it's None
+        """
+        with self.transaction() as cur:
+            for table_name in ('tiktoks', 'user_stats'):
+                self._create_partitions(cur, table_name, since)
+
+    def _create_partitions(self, cur, table_name: str, since=None):
+        """
+        Creates monthly partitions of the table from the month of $since or from the current month
+        for $partitions_ahead months ahead if they weren't created.
+
+        :param cur: the cursor of a transaction
+        :param table_name: the name of a table partitioned by range of time
+        :param since: datetime from which month the partitions are created, the current month if it's None
+        """
+        now = dt.now()
+        start = (since or now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        months = (now.year - start.year) * 12 + now.month - start.month
+        for _ in range(months + self.partitions_ahead + 1):
+            end = (start + timedelta(days=32)).replace(day=1)
+            partition_name = f'{table_name}_{start:%Y_%m}'
+            cur.execute("SELECT to_regclass(%(name)s) IS NOT NULL", {'name': partition_name})
+            if cur.fetchone()[0]:
+                start = end
+                continue
+
+            cur.execute("SAVEPOINT partition")
+            try:
+                self._create_partition(cur, table_name, partition_name, start, end)
+            except psycopg2.DatabaseError as e:
+                cur.execute("ROLLBACK TO SAVEPOINT partition")
+                logging.warning(f"The partition of {table_name} for {start:%Y-%m} wasn't created: {e}")
+            else:
+                cur.execute("RELEASE SAVEPOINT partition")
+            start = end
+
+    def _create_partition(self, cur, table_name: str, partition_name: str, start, end):
+        """
+        Creates a partition of the table for the range from $start to $end. A partition can't be created
+        while the default partition contains its rows, so the default partition is detached, its rows
+        of the range are moved into the new partition, and it's attached again.
+
+        :param cur: the cursor of a transaction
+        :param table_name: the name of a table partitioned by range of time
+        :param partition_name: the name of the new partition
+        :param start: datetime of the start of the range
+        :param end: datetime of the end of the range, which isn't included
+        """
+        table, partition, default = (sql.Identifier(name) for name in
+                                     (table_name, partition_name, f'{table_name}_default'))
+        bounds = {'start': start, 'end': end}
+        cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {0} WHERE time >= %(start)s AND time < %(end)s)").format(
+            default), bounds)
+        misplaced = cur.fetchone()[0]
+
+        if misplaced:
+            cur.execute(sql.SQL("ALTER TABLE {0} DETACH PARTITION {1}").format(table, default))
+        cur.execute(sql.SQL("CREATE TABLE {0} PARTITION OF {1} FOR VALUES FROM (%(start)s) TO (%(end)s)").format(
+            partition, table), bounds)
+        if misplaced:
+            cur.execute(sql.SQL("WITH moved AS (DELETE FROM {0} WHERE time >= %(start)s AND time < %(end)s "
+                                "RETURNING *) "
+                                "INSERT INTO {1} SELECT * FROM moved").format(default, partition), bounds)
+            logging.info(f"{cur.rowcount} rows of {table_name} were moved from the default partition "
+                         f"into {partition_name}")
+            cur.execute(sql.SQL("ALTER TABLE {0} ATTACH PARTITION {1} DEFAULT").format(table, default))
+
+    @contextmanager
+    def transaction(self, cursor_name: str = None):
+        """
+        Checks out a connection from the pool and yields its cursor. The transaction is committed
+        if the block succeeds and rolled back otherwise. Broken connections aren't returned into the pool.
+        If all the connections are used, it waits until one of them is returned.
+
+        :param cursor_name: the name of a server-side cursor, which fetches rows in parts
+        """
+        if self._pool is None:
             raise ValueError("Connection to the database wasn't made")
-        return self._connection
+
+        with self._semaphore:
+            connection = self._checkout()
+            broken = False
+            try:
+                with connection.cursor(name=cursor_name) as cur:
+                    yield cur
+                connection.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                broken = broken or connection.closed != 0
+                if broken:
+                    self._last_used.pop(id(connection), None)
+                else:
+                    self._last_used[id(connection)] = time.monotonic()
+                self._pool.putconn(connection, close=broken)
+
+    def _checkout(self):
+        """
+        Gets a healthy connection from the pool. If the database isn't available,
+        it tries to reconnect $reconnect_attempts times with growing delays.
+
+        :return: the connection object
+        """
+        for attempt in range(self.reconnect_attempts):
+            try:
+                connection = self._pool.getconn()
+            except psycopg2.OperationalError as e:
+                logging.warning(f"Connection to the database wasn't made, attempt {attempt + 1}: {e}")
+                time.sleep(self.reconnect_delay * 2 ** attempt)
+                continue
+
+            if self._is_healthy(connection):
+                return connection
+
+            self._last_used.pop(id(connection), None)
+            self._pool.putconn(connection, close=True)
+
+        raise psycopg2.OperationalError("Connection to the database couldn't be restored")
+
+    def _is_healthy(self, connection) -> bool:
+        """
+        Checks that the connection is open. Connections which were idle longer
+        than $health_check_interval are checked by a query.
+        """
+        if connection.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(connection), 0) < self.health_check_interval:
+            return True
+
+        try:
+            with connection.cursor() as cur:
+                cur.execute("SELECT 1")
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def close(self):
+        """
+        Closes all the connections to the database.
+        """
+        if self._pool is not None:
+            self._pool.closeall()
+
+    @reconnecting
+    def _execute(self, sql_query: str, parameters: dict = None):
+        """
+        Performs the sql query with passed arguments in its own transaction.
+
+        :param sql_query: sql query to the database
+        :param parameters: arguments of the query
+        """
+        with self.transaction() as cur:
+            cur.execute(sql_query, parameters)
 
     def _add_row(self, sql_query: str, **kwargs):
         """
@@ -94,11 +392,8 @@ class Database:
         :param kwargs: arguments of the query
         """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(sql_query, kwargs)
-            self.connection.commit()
+            self._execute(sql_query, kwargs)
         except Exception as e:
-            self.connection.rollback()
             logging.warning(e)
 
     def add_user(self, user):
@@ -114,7 +409,8 @@ class Database:
                                                           followers_cnt = EXCLUDED.followers_cnt,
                                                           following_cnt = EXCLUDED.following_cnt,
                                                           heart_cnt = EXCLUDED.heart_cnt,
-                                                          video_cnt = EXCLUDED.video_cnt
+                                                          video_cnt = EXCLUDED.video_cnt,
+                                                          updated = NOW()
                     """
         self._add_row(sql_query,
                       unique_id=user.unique_id,
@@ -133,9 +429,8 @@ class Database:
         sql_query = """
                     INSERT INTO tiktoks (id, user_id, description, time)
                     VALUES (%(id)s, %(unique_id)s, %(description)s, %(time)s)
-                    ON CONFLICT (id) DO UPDATE SET user_id = EXCLUDED.user_id,
-                                                   description = EXCLUDED.description,
-                                                   time = EXCLUDED.time
+                    ON CONFLICT (id, time) DO UPDATE SET user_id = EXCLUDED.user_id,
+                                                         description = EXCLUDED.description
                     """
 
         self._add_row(sql_query,
@@ -144,6 +439,23 @@ class Database:
                       description=tiktok.desc,
                       time=tiktok.time)
 
+    @reconnecting
+    def get_user_age(self, unique_id: str):
+        """
+        Returns time in seconds since the last update of a user. It's computed by the database,
+        so it doesn't depend on the clock and the time zone of the caller.
+
+        :param unique_id: the name of a user
+        :return: float or None if there is no such user
+        """
+        with self.transaction() as cur:
+            cur.execute("SELECT EXTRACT(EPOCH FROM LOCALTIMESTAMP - updated) FROM users "
+                        "WHERE unique_id = %(unique_id)s", {'unique_id': unique_id})
+            row = cur.fetchone()
+
+        return float(row[0]) if row else None
+
+    @reconnecting
     def get_last_timestamp(self, username: str):
         """
         Returns the timestamp of the last video of $username.
@@ -156,9 +468,9 @@ class Database:
                     FROM tiktoks
                     WHERE user_id = %(username)s;
                     """
-        cursor = self.connection.cursor()
-        cursor.execute(sql_query, {'username': username})
-        timestamp = cursor.fetchone()[0]
+        with self.transaction() as cur:
+            cur.execute(sql_query, {'username': username})
+            timestamp = cur.fetchone()[0]
 
         return timestamp if timestamp else dt.now()
 
@@ -215,6 +527,57 @@ class Database:
         """
         return self.get_data("bot_users")
 
+    def _get_columns(self, cur, table_name: str) -> list:
+        """
+        Returns the names of the columns of the table in their order. The names are cached,
+        since the tables aren't changed while the application works.
+
+        :param cur: a cursor of the database
+        :param table_name: the name of a table
+        :return: list of the names of the columns, the first one is the primary key
+        """
+        if table_name not in self._columns:
+            cur.execute("SELECT column_name FROM information_schema.columns "
+                        "WHERE table_name = %(table_name)s AND table_schema = current_schema() "
+                        "ORDER BY ordinal_position", {'table_name': table_name})
+            columns = [column[0] for column in cur.fetchall()]
+            if not columns:
+                return columns
+            self._columns[table_name] = columns
+
+        return self._columns[table_name]
+
+    def _get_upsert_query(self, cur, table_name: str, columns: tuple) -> str:
+        """
+        Returns the multi-row "UPSERT" query of the table updating the passed columns.
+        The queries are built once for each set of columns and cached.
+
+        :param cur: a cursor of the database
+        :param table_name: the name of a table
+        :param columns: the names of the columns, the first one is the primary key
+        :return: the query which values are passed by psycopg2.extras.execute_values
+        """
+        key = (table_name, columns)
+        if key not in self._queries:
+            if len(columns) > 1:
+                setting_columns = sql.SQL(',').join(
+                    sql.SQL("{0} = excluded.{0}").format(sql.Identifier(column)) for column in columns[1:])
+                action = sql.SQL("DO UPDATE SET {}").format(setting_columns)
+            else:
+                action = sql.SQL("DO NOTHING")
+
+            query = sql.SQL("INSERT INTO {0}({1}) "
+                            "VALUES %s "
+                            "ON CONFLICT ({2}) {3}").format(
+                sql.Identifier(table_name),
+                sql.SQL(',').join(map(sql.Identifier, columns)),
+                sql.Identifier(columns[0]),
+                action)
+            self._queries[key] = query.as_string(cur)
+
+        return self._queries[key]
+
+    @reconnecting
     def get_data(self, table_name: str) -> dict:
         """
         Method builds a query to get all data from the table of the database.
@@ -222,19 +585,16 @@ class Database:
         :param table_name: the name of a table
         :return: dictionary containing id and a list of arguments
         """
-        with self.connection.cursor() as cur:
-            query = sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_name = {};").format(
-                sql.Literal(table_name))
-            cur.execute(query)
-
-            columns = [column[0] for column in cur.fetchall()]
+        with self.transaction() as cur:
+            columns = self._get_columns(cur, table_name)
 
             if not columns:
-                logging.warning("The names of columns from the Chats table weren't received")
+                logging.warning("The names of columns from the {} table weren't received".format(table_name))
                 return {}
 
             # Get all data and create a dictionary
-            query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name))
+            query = sql.SQL("SELECT {0} FROM {1}").format(sql.SQL(',').join(map(sql.Identifier, columns)),
+                                                          sql.Identifier(table_name))
             cur.execute(query)
             data = cur.fetchall()
 
@@ -243,68 +603,84 @@ class Database:
             else:
                 return {}
 
+    @reconnecting
+    def get_row(self, table_name: str, id):
+        """
+        Method gets a row of the table of the database by its primary key.
+
+        :param table_name: the name of a table
+        :param id: the value of the primary key
+        :return: dictionary of the columns and their values or None if there is no such row
+        """
+        with self.transaction() as cur:
+            columns = self._get_columns(cur, table_name)
+
+            if not columns:
+                logging.warning("The names of columns from the {} table weren't received".format(table_name))
+                return None
+
+            query = sql.SQL("SELECT {0} FROM {1} WHERE {2} = %(id)s").format(
+                sql.SQL(',').join(map(sql.Identifier, columns[1:])),
+                sql.Identifier(table_name),
+                sql.Identifier(columns[0]))
+            cur.execute(query, {'id': id})
+            row = cur.fetchone()
+
+        return dict(zip(columns[1:], row)) if row else None
+
+    @reconnecting
     def update_data(self, table_name: str, data: dict):
         """
-        Method builds a query to update all data of the table of the database.
+        Method updates all data of the table of the database by multi-row "UPSERT" queries.
 
         :param table_name: the name of a table
         :param data: dictionary containing ids and a list of arguments with it
         """
-        if data:
-            # Iterate through all ids
+        if not data:
+            return
+
+        with self.transaction() as cur:
+            columns = self._get_columns(cur, table_name)
+
+            if not columns:
+                logging.warning("The names of columns from the {} table weren't received".format(table_name))
+                return
+
+            # Only the passed columns of a row are updated, therefore the rows are grouped by their columns
+            # and each group is written by its own query. Usually all the rows have the same columns
+            groups = defaultdict(list)
             for id, data_dict in data.items():
-                with self.connection.cursor() as cur:
-                    # Get all the names of the columns of the table
-                    query = sql.SQL("SELECT column_name FROM information_schema.columns WHERE table_name = {};").format(
-                        sql.Literal(table_name))
-                    cur.execute(query)
-                    columns = [column[0] for column in cur.fetchall() if column[0] in data[id] or 'id' in column[0]]
-
-                    # Build a list containing all values of this id
-                    values = [id]
-                    values.extend(data[id].get(column) for column in columns[1:])
-
-                    if not columns:
-                        logging.warning("The names of columns from the {} table weren't received".format(table_name))
-                        return {}
-
-                    # Build the SQL-string to use "UPSERT" function
-                    setting_columns = list(
-                        map(lambda x: sql.SQL("{0} = excluded.{0}").format(sql.Identifier(x)), columns[1:]))
-
-                    # Build a query
-                    query = sql.SQL("INSERT INTO {0}({1}) "
-                                    "VALUES ({2}) "
-                                    "ON CONFLICT ({3}) DO UPDATE SET "
-                                    "{4}").format(
-                        sql.Identifier(table_name),
-                        sql.SQL(',').join(map(sql.Identifier, columns)),
-                        sql.SQL(',').join(map(sql.Literal, values)),
-                        sql.Identifier(columns[0]),
-                        sql.SQL(',').join(setting_columns))
-                    cur.execute(query)
-            self.connection.commit()
+                row_columns = (columns[0],) + tuple(column for column in columns[1:]
+                                                    if column in data_dict or 'id' in column)
+                values = [id]
+                values.extend(data_dict.get(column) for column in row_columns[1:])
+                groups[row_columns].append(values)
+
+            for row_columns, rows in groups.items():
+                execute_values(cur, self._get_upsert_query(cur, table_name, row_columns), rows,
+                               page_size=self.page_size)
 
+    @reconnecting
     def delete_favourite_users(self, data: dict):
         """
         Delete rows of the favourite users table.
 
         :param data: a dictionary of {unique_id: list of unique_ids, chat_id: id of a chat}
         """
-        with self.connection.cursor() as cur:
+        with self.transaction() as cur:
             query = sql.SQL("DELETE FROM favourite_users WHERE chat_id = {0} AND unique_id IN ({1})").format(
                 sql.Literal(data['chat_id']),
                 sql.SQL(',').join(map(sql.Literal, data['unique_id'])))
             cur.execute(query)
-        self.connection.commit()
 
+    @reconnecting
     def add_favourite_users(self, data: dict):
         """
         Add rows of the favourite users table.
 
         :param data: a dictionary of {unique_id: list of unique_ids, chat_id: id of a chat}
         """
-        with self.connection.cursor() as cur:
+        with self.transaction() as cur:
             for unique_id in data['unique_id']:
                 query = sql.SQL("INSERT INTO favourite_users (unique_id, chat_id) "
                                 "VALUES ({0}, {1}) "
@@ -313,7 +689,6 @@ class Database:
                     sql.Literal(unique_id),
                     sql.Literal(data['chat_id']))
                 cur.execute(query)
-        self.connection.commit()
 
     def update_chat_data(self, chat_data: dict):
         """
@@ -338,6 +713,7 @@ class Database:
         else:
             self.add_favourite_users(bot_data)
 
+    @reconnecting
     def get_chats_favourite_users(self, unique_id: str):
         """
         Method returns a list of ids of chats associated with the certain tiktoker.
@@ -345,7 +721,7 @@ class Database:
         :param unique_id: the nickname of a tiktoker
         :return: a list of chat ids
         """
-        with self.connection.cursor() as cur:
+        with self.transaction() as cur:
             query = sql.SQL("SELECT chat_id FROM favourite_users "
                             "WHERE unique_id = {}").format(sql.Literal(unique_id))
             cur.execute(query)
@@ -353,13 +729,14 @@ class Database:
 
         return chat_ids
 
+    @reconnecting
     def get_favourite_users(self, chat_id=None):
         """
         Method returns a list of unique ids containing in the database.
 
         :return: a list of unique ids
         """
-        with self.connection.cursor() as cur:
+        with self.transaction() as cur:
             if chat_id is None:
                 query = sql.SQL("SELECT DISTINCT unique_id FROM favourite_users")
             else:
@@ -1,21 +1,67 @@
 import os
 from database.db import Database
 from tiktokinformerbot.bot import TikTokInformerBot
+from tiktokinformerbot.persistence import BotPersistence
+from tiktokinformerbot.profiles import ProfileCache
+from tiktokinformerbot.fetchers import get_fetcher
+from tiktokinformerbot.sessions import SessionPool
+from tiktokinformerbot.governor import Governor
 
 PG_HOST = os.getenv('PG_HOST')
 PG_PORT = os.getenv('PG_PORT')
 PG_NAME = os.getenv('PG_NAME')
 PG_USER = os.getenv('PG_USER')
 PG_PASS = os.getenv('PG_PASS')
+# Bounds of the pool of connections to the database
+PG_MIN_CONNECTIONS = int(os.getenv('PG_MIN_CONNECTIONS', 1))
+PG_MAX_CONNECTIONS = int(os.getenv('PG_MAX_CONNECTIONS', 4))
 TOKEN = os.getenv('TOKEN')
+# The backend requesting TikTok profiles: selenium, selenium-pool, http or fake
+FETCH_BACKEND = os.getenv('FETCH_BACKEND', 'selenium')
+# Count of browser sessions of the selenium-pool backend, count of requests and resident memory in megabytes
+# after which a session is recycled
+BROWSER_SESSIONS = int(os.getenv('BROWSER_SESSIONS', SessionPool.size))
+SESSION_MAX_REQUESTS = int(os.getenv('SESSION_MAX_REQUESTS', SessionPool.max_requests))
+SESSION_MAX_RSS = int(os.getenv('SESSION_MAX_RSS', SessionPool.max_rss // 1024 ** 2))
+# The ceiling of the rate of requests to TikTok per second shared by the bot and the informer, 0 disables the limit,
+# the part of it reserved for the bot, and maximum count of requests at the same time
+FETCH_MAX_RATE = float(os.getenv('FETCH_MAX_RATE', Governor.max_rate))
+BOT_FETCH_MAX_RATE = float(os.getenv('BOT_FETCH_MAX_RATE', Governor.rate))
+FETCH_MAX_CONCURRENCY = int(os.getenv('FETCH_MAX_CONCURRENCY', Governor.max_concurrency))
+# Time in seconds which changes of the chats are collected for and their count to write them immediately
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', BotPersistence.flush_interval))
+PERSISTENCE_FLUSH_COUNT = int(os.getenv('PERSISTENCE_FLUSH_COUNT', BotPersistence.flush_count))
+# Count of chats and users kept in memory
+PERSISTENCE_CACHE_SIZE = int(os.getenv('PERSISTENCE_CACHE_SIZE', BotPersistence.cache_size))
+# Time in seconds which existing and missing TikTok profiles are cached for
+PROFILES_TTL = float(os.getenv('PROFILES_TTL', ProfileCache.ttl))
+MISSING_PROFILES_TTL = float(os.getenv('MISSING_PROFILES_TTL', ProfileCache.missing_ttl))
+# Count of TikTok profiles checked at the same time
+VALIDATION_WORKERS = int(os.getenv('VALIDATION_WORKERS', TikTokInformerBot.validation_workers))
+
+FETCH_OPTIONS = dict(size=BROWSER_SESSIONS,
+                     max_requests=SESSION_MAX_REQUESTS,
+                     max_rss=SESSION_MAX_RSS * 1024 ** 2) if FETCH_BACKEND == 'selenium-pool' else {}
+if FETCH_MAX_RATE:
+    # The informer takes the rest of the ceiling, so together they don't exceed it
+    FETCH_OPTIONS['governor'] = dict(max_rate=min(BOT_FETCH_MAX_RATE, FETCH_MAX_RATE),
+                                     max_concurrency=FETCH_MAX_CONCURRENCY)
 
 
 def main():
     bot_db = Database.connect(host=PG_HOST, port=PG_PORT,
                               user=PG_USER, password=PG_PASS,
-                              database=PG_NAME)
+                              database=PG_NAME,
+                              min_connections=PG_MIN_CONNECTIONS,
+                              max_connections=PG_MAX_CONNECTIONS)
 
-    bot = TikTokInformerBot(token=TOKEN, database=bot_db)
+    bot = TikTokInformerBot(token=TOKEN, database=bot_db, fetcher=get_fetcher(FETCH_BACKEND, **FETCH_OPTIONS),
+                            flush_interval=PERSISTENCE_FLUSH_INTERVAL,
+                            flush_count=PERSISTENCE_FLUSH_COUNT,
+                            cache_size=PERSISTENCE_CACHE_SIZE,
+                            profiles_ttl=PROFILES_TTL,
+                            missing_profiles_ttl=MISSING_PROFILES_TTL,
+                            validation_workers=VALIDATION_WORKERS)
     bot.run()
 
 
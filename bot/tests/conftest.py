@@ -0,0 +1,9 @@
+"""
+The tests are run from the bot directory, which the modules are imported from:
+
+    python3 -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,165 @@
+from copy import copy, deepcopy
+from queue import Queue
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('telegram')
+
+from telegram import Bot
+from telegram.ext import Dispatcher
+from tiktokinformerbot.persistence import BotPersistence, LazyData
+
+
+class Table:
+    def __init__(self, rows: dict):
+        self.rows = rows
+        self.loads = []
+
+    def load(self, key):
+        self.loads.append(key)
+        return self.rows.get(key)
+
+
+class FakeDatabase:
+    def __init__(self, tables: dict = None, failing: set = ()):
+        self.tables = tables or {}
+        self.failing = set(failing)
+        self.writes = []
+
+    def get_row(self, table_name: str, id):
+        return self.tables.get(table_name, {}).get(id)
+
+    def get_conversations(self):
+        return {}
+
+    def _update(self, table_name: str, data: dict):
+        if table_name in self.failing:
+            raise RuntimeError(f'{table_name} is unavailable')
+        self.writes.append((table_name, sorted(data)))
+
+    def update_conversations(self, conversations: dict):
+        self._update('conversations', {key[0] for states in conversations.values() for key in states})
+
+    def update_chat_data(self, chat_data: dict):
+        self._update('chats', chat_data)
+
+    def update_user_data(self, user_data: dict):
+        self._update('bot_users', user_data)
+
+
+def test_rows_are_loaded_once():
+    table = Table({1: {'title': 'first'}})
+    data = LazyData(table.load, capacity=10)
+
+    assert data[1] == {'title': 'first'}
+    assert data[1] == {'title': 'first'}
+    assert table.loads == [1]
+
+
+def test_missing_row_is_empty():
+    data = LazyData(Table({}).load, capacity=10)
+
+    assert data[1] == {}
+    data[1]['title'] = 'new'
+    assert data[1] == {'title': 'new'}
+
+
+def test_least_recently_accessed_rows_are_evicted():
+    table = Table({key: {'key': key} for key in range(3)})
+    data = LazyData(table.load, capacity=2)
+
+    data[0]
+    data[1]
+    # The access moves the first row to the end
+    data[0]
+    data[2]
+
+    assert 1 not in data
+    assert 0 in data and 2 in data
+    assert data[1] == {'key': 1}
+    assert table.loads == [0, 1, 2, 1]
+
+
+def test_pinned_rows_arent_evicted():
+    dirty = {0}
+    table = Table({key: {'key': key} for key in range(3)})
+    data = LazyData(table.load, capacity=1, evictable=lambda key: key not in dirty)
+
+    data[0]['key'] = 'changed'
+    data[1]
+    data[2]
+
+    assert data[0] == {'key': 'changed'}
+    assert 1 not in data
+    assert table.loads == [0, 1, 2]
+
+
+def test_copy_keeps_loader():
+    table = Table({key: {'key': key} for key in range(3)})
+    data = LazyData(table.load, capacity=2)
+    data[0]
+
+    for copied in (copy(data), deepcopy(data), data.copy()):
+        assert isinstance(copied, LazyData)
+        assert copied[1] == {'key': 1}
+        copied[2]
+        assert 0 not in copied
+
+
+def test_data_goes_through_persistence_wrapper():
+    database = FakeDatabase({'chats': {42: {'title': 'chat'}}, 'bot_users': {7: {'username': 'user'}}})
+    persistence = BotPersistence(database, store_bot_data=False, on_flush=True)
+
+    # BasePersistence copies the data by insert_bot before it returns them
+    chat_data = persistence.get_chat_data()
+    user_data = persistence.get_user_data()
+
+    assert chat_data[42] == {'title': 'chat'}
+    assert chat_data[1] == {}
+    assert user_data[7] == {'username': 'user'}
+
+
+def test_dispatcher_reads_data_of_chats():
+    database = FakeDatabase({'chats': {42: {'title': 'chat'}}})
+    persistence = BotPersistence(database, store_bot_data=False, on_flush=True)
+    dispatcher = Dispatcher(Bot('123:token'), Queue(), persistence=persistence)
+
+    assert dispatcher.chat_data[42] == {'title': 'chat'}
+    assert dispatcher.chat_data[1] == {}
+
+
+def changed_persistence(database: FakeDatabase) -> BotPersistence:
+    persistence = BotPersistence(database, store_bot_data=False, on_flush=True)
+    persistence.update_user_data(7, {'username': 'user'})
+    persistence.update_chat_data(42, {'title': 'chat'})
+    persistence.update_conversation('start', (42,), 1)
+    return persistence
+
+
+def test_conversations_are_written_first():
+    database = FakeDatabase()
+    changed_persistence(database)._write()
+
+    assert database.writes == [('conversations', [42]), ('chats', [42]), ('bot_users', [7])]
+
+
+def test_rows_referencing_failed_conversations_are_written_later():
+    database = FakeDatabase(failing={'conversations'})
+    persistence = changed_persistence(database)
+    persistence._write()
+    assert database.writes == []
+
+    database.failing.clear()
+    persistence._write()
+    assert database.writes == [('conversations', [42]), ('chats', [42]), ('bot_users', [7])]
+
+
+def test_only_failed_table_is_written_again():
+    database = FakeDatabase(failing={'chats'})
+    persistence = changed_persistence(database)
+    persistence._write()
+    assert database.writes == [('conversations', [42]), ('bot_users', [7])]
+
+    database.failing.clear()
+    persistence._write()
+    assert database.writes[2:] == [('chats', [42])]
@@ -1,6 +1,9 @@
 import tiktokinformerbot.handlers as handlers
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from tiktokinformerbot.persistence import BotPersistence
+from tiktokinformerbot.profiles import ProfileCache
+from tiktokinformerbot.fetchers import Fetcher
 from database.db import Database
 from telegram.ext import Updater, CommandHandler, ConversationHandler, MessageHandler, Filters
 
@@ -9,14 +12,34 @@ logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s
 
 
 class TikTokInformerBot:
-    def __init__(self, token: str, database: Database):
-        persistence = BotPersistence(database)
+    # Count of TikTok profiles checked at the same time
+    validation_workers = 8
+
+    def __init__(self, token: str, database: Database, fetcher: Fetcher,
+                 flush_interval: float = None,
+                 flush_count: int = None,
+                 cache_size: int = None,
+                 profiles_ttl: float = None,
+                 missing_profiles_ttl: float = None,
+                 validation_workers: int = None):
+        # The subscriptions are written into the database by the handlers, so the bot_data isn't stored
+        persistence = BotPersistence(database,
+                                     store_bot_data=False,
+                                     flush_interval=flush_interval,
+                                     flush_count=flush_count,
+                                     cache_size=cache_size)
 
         self.database = database
 
         self.updater = Updater(token=token, use_context=True, persistence=persistence)
         self.dispatcher = self.updater.dispatcher
         self.dispatcher.bot_data['database'] = database
+        self.dispatcher.bot_data['profiles'] = ProfileCache(database, ttl=profiles_ttl,
+                                                            missing_ttl=missing_profiles_ttl)
+        self.dispatcher.bot_data['fetcher'] = fetcher
+        # The pool checking that TikTok profiles exist
+        self.dispatcher.bot_data['executor'] = ThreadPoolExecutor(
+            max_workers=validation_workers or self.validation_workers)
         self.job_queue = self.updater.job_queue
 
         # Dictionary with the chat_id and entries of this chat that a user want to add.
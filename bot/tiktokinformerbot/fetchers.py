@@ -0,0 +1,257 @@
+"""
+Module for the backends requesting TikTok profiles. Every backend returns the dictionary of a profile
+in the shape which TikTok puts into its pages: it contains 'uniqueId', 'userInfo' and 'items',
+which are consumed by the User and the Tiktok classes.
+"""
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from TikTokApi import TikTokApi
+from TikTokApi.exceptions import TikTokNotFoundError
+from tiktokinformerbot.sessions import SessionPool
+from tiktokinformerbot.governor import Governor
+
+
+class ProfileNotFoundError(Exception):
+    pass
+
+
+class Fetcher:
+    """
+    The base class of the backends. It measures count and duration of the requests
+    and lets them through the governor if it's set.
+    """
+    # Count of requests which the backend can make at the same time, None if it isn't limited
+    concurrency = None
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.seconds = 0
+        self.governor = None
+        self._lock = threading.Lock()
+        # Requests beyond the concurrency of the backend wait for it here
+        self._slots = threading.BoundedSemaphore(self.concurrency) if self.concurrency else contextlib.nullcontext()
+
+    def acquire(self):
+        """
+        Waits until the governor lets a request through. It's called before get_user with $acquired,
+        so the waiting isn't counted in the timeout of the request.
+        """
+        if self.governor is not None:
+            self.governor.acquire()
+
+    def get_user(self, username: str, acquired: bool = False) -> dict:
+        """
+        Requests the profile from TikTok.
+
+        :param username: unique name of a TikTok profile
+        :param acquired: whether the governor was already acquired by the acquire method
+        :return: the dictionary of the profile
+        :raises ProfileNotFoundError: if the profile doesn't exist
+        """
+        if not acquired:
+            self.acquire()
+
+        # Waiting for the backend isn't a part of the response, so the request is timed when it's made
+        with self._slots:
+            started = time.perf_counter()
+            failed = False
+            try:
+                return self._get_user(username)
+            except ProfileNotFoundError:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                seconds = time.perf_counter() - started
+                # A missing profile is a healthy response, it doesn't slow the requests down
+                if self.governor is not None:
+                    self.governor.release(not failed, seconds)
+                with self._lock:
+                    self.requests += 1
+                    self.failures += failed
+                    self.seconds += seconds
+
+    def exists(self, username: str) -> bool:
+        """
+        Returns whether the profile exists.
+
+        :param username: unique name of a TikTok profile
+        """
+        try:
+            self.get_user(username)
+        except ProfileNotFoundError:
+            return False
+        return True
+
+    def stats(self) -> dict:
+        """
+        Returns count of requests, count of failed ones, the average duration of a request in seconds
+        and statistics of the governor prefixed with 'governor_'.
+        """
+        with self._lock:
+            statistics = {'requests': self.requests,
+                          'failures': self.failures,
+                          'average': self.seconds / self.requests if self.requests else 0}
+        if self.governor is not None:
+            statistics.update({f'governor_{key}': value for key, value in self.governor.stats().items()})
+        return statistics
+
+    def close(self):
+        pass
+
+    def _get_user(self, username: str) -> dict:
+        raise NotImplementedError
+
+
+class SeleniumFetcher(Fetcher):
+    """
+    The backend using TikTokApi with a headless browser. The browser isn't thread-safe,
+    so the requests are made one at a time, use PooledSeleniumFetcher to make them concurrently.
+    """
+    concurrency = 1
+
+    def __init__(self):
+        super(SeleniumFetcher, self).__init__()
+        self.api = TikTokApi.get_instance(use_selenium=True)
+
+    def _get_user(self, username: str) -> dict:
+        try:
+            return self.api.getUser(username=username)
+        except TikTokNotFoundError:
+            raise ProfileNotFoundError(username)
+
+
+class PooledSeleniumFetcher(Fetcher):
+    """
+    The backend using a pool of warm TikTokApi sessions, so profiles are requested by several browsers
+    at the same time. Each session is recycled after a count of requests or when its memory exceeds the limit.
+    """
+    def __init__(self, size: int = None, max_requests: int = None, max_rss: int = None):
+        """
+        :param size: count of browser sessions
+        :param max_requests: count of requests after which a session is recycled
+        :param max_rss: resident memory in bytes after which a session is recycled
+        """
+        super(PooledSeleniumFetcher, self).__init__()
+        self.pool = SessionPool(size=size, max_requests=max_requests, max_rss=max_rss)
+
+    def _get_user(self, username: str) -> dict:
+        try:
+            return self.pool.get_user(username)
+        except TikTokNotFoundError:
+            raise ProfileNotFoundError(username)
+
+    def stats(self) -> dict:
+        """
+        Returns statistics of the requests along with statistics of the pool prefixed with 'pool_'.
+        """
+        statistics = super(PooledSeleniumFetcher, self).stats()
+        statistics.update({f'pool_{key}': value for key, value in self.pool.stats().items()})
+        return statistics
+
+    def close(self):
+        self.pool.close()
+
+
+class HttpFetcher(Fetcher):
+    """
+    The backend requesting the page of a profile over a pool of keep-alive connections
+    and taking the profile from the JSON embedded into the page.
+    """
+    url = 'https://www.tiktok.com/@{}?lang=en'
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                             '(KHTML, like Gecko) Chrome/88.0.4324.150 Safari/537.36',
+               'Accept': 'text/html,application/xhtml+xml',
+               'Accept-Language': 'en-US,en;q=0.9'}
+    # The status which TikTok returns in the page of a missing profile
+    not_found_status = 10202
+
+    _next_data = re.compile(r'<script id="__NEXT_DATA__" type="application/json"[^>]*>(.+?)</script>', re.S)
+
+    def __init__(self, pool_size: int = 10, timeout: float = 10):
+        """
+        :param pool_size: count of connections kept open
+        :param timeout: timeout of a request in seconds
+        """
+        super(HttpFetcher, self).__init__()
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def _get_user(self, username: str) -> dict:
+        response = self.session.get(self.url.format(username), timeout=self.timeout)
+        if response.status_code == 404:
+            raise ProfileNotFoundError(username)
+        response.raise_for_status()
+
+        match = self._next_data.search(response.text)
+        if match is None:
+            raise ValueError(f"The page of the profile @{username} doesn't contain its data")
+
+        props = json.loads(match.group(1))['props']['pageProps']
+        if props.get('statusCode') == self.not_found_status or 'userInfo' not in props:
+            raise ProfileNotFoundError(username)
+
+        props.setdefault('uniqueId', props['userInfo']['user']['uniqueId'])
+        props.setdefault('items', [])
+        return props
+
+    def close(self):
+        self.session.close()
+
+
+class FakeFetcher(Fetcher):
+    """
+    The local backend for tests and benchmarks. Profiles are taken from the passed dictionary
+    or from JSON files named as the profiles in the directory.
+    """
+    def __init__(self, profiles: dict = None, directory: str = None):
+        super(FakeFetcher, self).__init__()
+        self.profiles = profiles or {}
+        self.directory = directory
+
+    def _get_user(self, username: str) -> dict:
+        if username in self.profiles:
+            return self.profiles[username]
+
+        if self.directory is not None:
+            path = os.path.join(self.directory, f'{username}.json')
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as file:
+                    return json.load(file)
+
+        raise ProfileNotFoundError(username)
+
+
+BACKENDS = {'selenium': SeleniumFetcher,
+            'selenium-pool': PooledSeleniumFetcher,
+            'http': HttpFetcher,
+            'fake': FakeFetcher}
+
+
+def get_fetcher(backend: str, governor: dict = None, **kwargs) -> Fetcher:
+    """
+    Creates the backend by its name.
+
+    :param backend: one of the names of $BACKENDS
+    :param governor: the keyword arguments of the Governor limiting the requests, they aren't limited if it's None
+    :param kwargs: arguments of the backend
+    :return: the Fetcher object
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown fetch backend {backend}, use one of: {', '.join(BACKENDS)}")
+
+    fetcher = BACKENDS[backend](**kwargs)
+    if governor is not None:
+        fetcher.governor = Governor(**governor)
+    return fetcher
@@ -0,0 +1,92 @@
+"""
+Module for limiting of the rate of requests to TikTok. The governor lets requests through a token bucket
+and limits count of requests at the same time. Both limits are raised additively while the responses
+are healthy and lowered multiplicatively when requests fail or become slow, so the rate stays close
+to the one which TikTok tolerates.
+"""
+import threading
+import time
+
+
+class Governor:
+    # Bounds of the rate of requests per second and its initial value
+    min_rate = 0.2
+    max_rate = 10
+    rate = 1
+    # Maximum count of requests at the same time
+    max_concurrency = 16
+    # The rate is raised by $increase after a healthy response and multiplied by $decrease after a failure
+    increase = 0.1
+    decrease = 0.5
+    # Duration of a request in seconds after which it's considered slow
+    slow = 10
+    # Time in seconds after a decrease during which the next failures don't decrease the limits again,
+    # since the requests sent at the same rate fail together
+    cooldown = 10
+
+    def __init__(self, max_rate: float = None, max_concurrency: int = None):
+        """
+        :param max_rate: maximum count of requests per second
+        :param max_concurrency: maximum count of requests at the same time
+        """
+        if max_rate:
+            self.max_rate = max_rate
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+
+        # A share of the ceiling might be lower than the default bounds
+        self.min_rate = min(self.min_rate, self.max_rate)
+        self.rate = min(self.rate, self.max_rate)
+        self.concurrency = 1
+        self._tokens = 1
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._last_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits until a request is allowed by the rate and the count of requests at the same time.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                # The bucket holds one token, so requests aren't sent in bursts
+                self._tokens = min(1, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._in_flight >= int(self.concurrency):
+                    self._condition.wait()
+                elif self._tokens < 1:
+                    self._condition.wait((1 - self._tokens) / self.rate)
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+
+    def release(self, healthy: bool, seconds: float):
+        """
+        Adjusts the limits by the result of a request allowed by $acquire.
+
+        :param healthy: whether the request succeeded
+        :param seconds: duration of the request
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if healthy and seconds < self.slow:
+                self.rate = min(self.rate + self.increase, self.max_rate)
+                # The concurrency is raised by one after as many healthy responses as requests are allowed at once
+                self.concurrency = min(self.concurrency + 1 / self.concurrency, self.max_concurrency)
+            elif now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.rate = max(self.rate * self.decrease, self.min_rate)
+                self.concurrency = max(self.concurrency * self.decrease, 1)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Returns the current rate, the current limit of requests at the same time and count of running requests.
+        """
+        with self._condition:
+            return {'rate': self.rate, 'concurrency': int(self.concurrency), 'in_flight': self._in_flight}
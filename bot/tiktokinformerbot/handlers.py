@@ -5,8 +5,6 @@ import re
 import telegram
 from dialog import reader
 from telegram.ext import Updater
-from TikTokApi import TikTokApi
-from TikTokApi.exceptions import TikTokNotFoundError
 
 # Define all the states of the bot
 MAIN, = range(1)
@@ -76,31 +74,49 @@ def main_menu_handler(update: telegram.Update, context: telegram.ext.CallbackCon
             break
 
     if correct:
-        api = TikTokApi.get_instance(use_selenium=True)
-        for unique_id in unique_ids:
-            try:
-                # Check that users exist
-                api.getUser(username=unique_id)
-            except TikTokNotFoundError:
-                context.bot.sendMessage(chat_id=update.effective_chat.id,
-                                        text=f"Кажется, профиля с именем @{unique_id} не существует...\n"
-                                             f"Пожалуйста, измените запрос.")
-                return MAIN
-
-        if delete:
-            message = "Я удалил этих тиктокеров из вашего профиля. Не такие они и классные..."
-        else:
-            message = "Я добавил перечисленных тиктокеров к вам в профиль. Надеюсь, вы не ошибаетесь :)"
-
         context.bot.sendMessage(chat_id=update.effective_chat.id,
-                                text=message)
-        update_bot_data(update, context, unique_ids=unique_ids, delete=delete)
+                                text="Проверяю профили, это займёт немного времени...")
+        # The profiles are checked apart from the dispatcher, so other chats don't wait for TikTok
+        context.dispatcher.run_async(check_profiles_handler, update, context, unique_ids, delete, update=update)
     else:
         context.bot.sendMessage(chat_id=update.effective_chat.id,
                                 text="Я не понимаю о чём вы говорите :(")
     return MAIN
 
 
+def check_profiles_handler(update: telegram.Update, context: telegram.ext.CallbackContext,
+                           unique_ids: list, delete: bool):
+    """
+    The handler checking that all the profiles exist in parallel and updating the subscriptions of the chat.
+    """
+    profiles = context.bot_data['profiles']
+    fetcher = context.bot_data['fetcher']
+    executor = context.bot_data['executor']
+
+    try:
+        exist = list(executor.map(lambda unique_id: profiles.exists(unique_id, fetcher.exists), unique_ids))
+    except Exception:
+        context.bot.sendMessage(chat_id=update.effective_chat.id,
+                                text="Не получилось проверить профили, попробуйте ещё раз чуть позже.")
+        raise
+
+    missing = [f"@{unique_id}" for unique_id, exists in zip(unique_ids, exist) if not exists]
+    if missing:
+        context.bot.sendMessage(chat_id=update.effective_chat.id,
+                                text=f"Кажется, профиля с именем {', '.join(missing)} не существует...\n"
+                                     f"Пожалуйста, измените запрос.")
+        return
+
+    if delete:
+        message = "Я удалил этих тиктокеров из вашего профиля. Не такие они и классные..."
+    else:
+        message = "Я добавил перечисленных тиктокеров к вам в профиль. Надеюсь, вы не ошибаетесь :)"
+
+    context.bot.sendMessage(chat_id=update.effective_chat.id,
+                            text=message)
+    update_bot_data(update, context, unique_ids=unique_ids, delete=delete)
+
+
 def update_chat_data(update: telegram.Update, context: telegram.ext.CallbackContext):
     """
     Function to update the chat_data receiving from the user.
@@ -121,6 +137,11 @@ def update_user_data(update: telegram.Update, context: telegram.ext.CallbackCont
 
 
 def update_bot_data(update: telegram.Update, context: telegram.ext.CallbackContext, unique_ids: list, delete=False):
-    context.bot_data['unique_id'] = unique_ids
-    context.bot_data['chat_id'] = update.effective_chat.id
-    context.bot_data['delete'] = delete
+    """
+    Function to update the subscriptions of the chat. They're written into the database directly,
+    since the bot_data is shared by all the chats, which are processed at the same time.
+    """
+    database = context.bot_data['database']
+    database.update_bot_data({'unique_id': unique_ids,
+                              'chat_id': update.effective_chat.id,
+                              'delete': delete})
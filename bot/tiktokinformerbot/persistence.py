@@ -1,61 +1,170 @@
 """
 This method implements the inheritance from the BasePersistence class to provide the persistence of the bot.
 """
+import atexit
+import logging
+import threading
 from database.db import Database
 from telegram.ext import BasePersistence
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from copy import deepcopy
 
 
+class LazyData(defaultdict):
+    """
+    Dictionary of rows of a table which loads a row by $load the first time the row is accessed.
+    Only $capacity of the last accessed rows are kept in memory, the older ones are evicted
+    if $evictable allows it and are loaded again when they're accessed.
+    """
+    def __init__(self, load, capacity: int, evictable=None):
+        super(LazyData, self).__init__(dict)
+        self._load = load
+        self._capacity = capacity
+        self._evictable = evictable
+        self._recent = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            if dict.__contains__(self, key):
+                self._recent.move_to_end(key)
+                return dict.__getitem__(self, key)
+
+        # The row is loaded without the lock, so other rows may be accessed meanwhile
+        row = self._load(key)
+
+        with self._lock:
+            if not dict.__contains__(self, key):
+                self[key] = self.default_factory() if row is None else row
+            self._recent.move_to_end(key)
+            return dict.__getitem__(self, key)
+
+    def __missing__(self, key):
+        return self[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            super(LazyData, self).__setitem__(key, value)
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            super(LazyData, self).__delitem__(key)
+            self._recent.pop(key, None)
+
+    def __copy__(self):
+        """
+        Returns a copy with the same loader, capacity and evictable and the loaded rows. The persistence
+        of the bot copies the data it returns, and the copy of defaultdict would lose them.
+        """
+        with self._lock:
+            data = self.__class__(self._load, self._capacity, self._evictable)
+            for key in self._recent:
+                dict.__setitem__(data, key, dict.__getitem__(self, key))
+                data._recent[key] = None
+            return data
+
+    copy = __copy__
+
+    def __reduce__(self):
+        with self._lock:
+            return self.__class__, (self._load, self._capacity, self._evictable), None, None, \
+                   iter(list(dict.items(self)))
+
+    def clear(self):
+        with self._lock:
+            super(LazyData, self).clear()
+            self._recent.clear()
+
+    def _evict(self):
+        """
+        Evicts the least recently accessed rows until there are $capacity rows.
+        The last accessed row isn't evicted even if the older ones can't be.
+        """
+        if len(self._recent) <= self._capacity:
+            return
+
+        for key in list(self._recent)[:-1]:
+            if len(self._recent) <= self._capacity:
+                break
+            if self._evictable is None or self._evictable(key):
+                super(LazyData, self).__delitem__(key)
+                del self._recent[key]
+
+
 class BotPersistence(BasePersistence):
+    # Time in seconds which changes are collected for before they're written into the database
+    flush_interval = 5
+    # Count of changed rows after which they're written into the database without waiting for the interval
+    flush_count = 100
+    # Count of chats and users kept in memory
+    cache_size = 10000
+
     def __init__(self, database: Database,
                  store_user_data=True,
                  store_chat_data=True,
                  store_bot_data=True,
-                 on_flush=False):
+                 on_flush=False,
+                 flush_interval: float = None,
+                 flush_count: int = None,
+                 cache_size: int = None):
+        """
+        :param on_flush: if it's True, changes are written into the database only when the bot is stopped
+        :param flush_interval: time in seconds which changes are collected for
+        :param flush_count: count of changed rows after which they're written immediately
+        :param cache_size: count of chats and users kept in memory
+        """
         super(BotPersistence, self).__init__(store_user_data=store_user_data,
                                              store_chat_data=store_chat_data,
                                              store_bot_data=store_bot_data)
         self.database = database
         self.on_flush = on_flush
-        self.user_data = None
-        self.chat_data = None
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if flush_count is not None:
+            self.flush_count = flush_count
+        if cache_size is not None:
+            self.cache_size = cache_size
+
+        # Keys of the rows changed since the last write: ids of chats, ids of users and (name, key) of conversations
+        self._dirty_chats = set()
+        self._dirty_users = set()
+        self._dirty_conversations = set()
+
+        # The rows which haven't been written yet mustn't be evicted
+        self.user_data = LazyData(lambda user_id: self.database.get_row('bot_users', user_id),
+                                  capacity=self.cache_size,
+                                  evictable=lambda user_id: user_id not in self._dirty_users)
+        self.chat_data = LazyData(lambda chat_id: self.database.get_row('chats', chat_id),
+                                  capacity=self.cache_size,
+                                  evictable=lambda chat_id: chat_id not in self._dirty_chats)
         self.bot_data = None
         self.conversations = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+
+        # Changes mustn't be lost even if the bot is stopped without calling flush
+        atexit.register(self._write)
 
     def get_user_data(self):
-        """Returns the user_data from the pickle file if it exsists or an empty defaultdict.
+        """Returns the user_data which rows are loaded from the database when they're accessed.
         Returns:
             :obj:`defaultdict`: The restored user data.
         """
-        if self.user_data:
-            pass
-        else:
-            data = self.database.get_user_data()
-            if not data:
-                data = defaultdict(dict)
-            else:
-                data = defaultdict(dict, data)
-            self.user_data = data
-
-        return deepcopy(self.user_data)
+        # The rows which haven't been written yet mustn't be evicted on the side of the dispatcher either
+        return LazyData(lambda user_id: deepcopy(self.user_data[user_id]), capacity=self.cache_size,
+                        evictable=lambda user_id: user_id not in self._dirty_users)
 
     def get_chat_data(self) -> dict:
         """
-        Returns the chat_data from the database.
+        Returns the chat_data which rows are loaded from the database when they're accessed.
         :return: The restored chat data.
         """
-        if self.chat_data:
-            pass
-        else:
-            data = self.database.get_chat_data()
-            if not data:
-                data = defaultdict(dict)
-            else:
-                data = defaultdict(dict, data)
-            self.chat_data = data
-
-        return deepcopy(self.chat_data)
+        return LazyData(lambda chat_id: deepcopy(self.chat_data[chat_id]), capacity=self.cache_size,
+                        evictable=lambda chat_id: chat_id not in self._dirty_chats)
 
     def get_conversations(self, name):
         if self.conversations:
@@ -70,61 +179,130 @@ class BotPersistence(BasePersistence):
 
     def update_chat_data(self, chat_id, data):
         """
-        Will update the chat_data (if changed) and save the data into the database.
+        Will update the chat_data (if changed) and schedule writing of the chat into the database.
         :param chat_id: The chat the data might have been changed for.
         :param data: The :attr:`telegram.ext.dispatcher.chat_data` [chat_id].
         """
-        if self.chat_data is None:
-            self.chat_data = defaultdict(dict)
-        if self.chat_data.get(chat_id) == data:
-            return
-        self.chat_data[chat_id] = data
-        if not self.on_flush:
-            self.database.update_chat_data(self.chat_data)
+        with self._lock:
+            if self.chat_data.get(chat_id) == data:
+                return
+            # The dispatcher passes its own dictionary, so a copy is kept to notice the next changes
+            self.chat_data[chat_id] = deepcopy(data)
+            self._dirty_chats.add(chat_id)
+        self._changed()
 
     def update_user_data(self, user_id, data):
-        """Will update the user_data (if changed) and depending on :attr:`on_flush` save the
-        pickle file.
+        """Will update the user_data (if changed) and depending on :attr:`on_flush` schedule writing
+        of the user into the database.
         Args:
             user_id (:obj:`int`): The user the data might have been changed for.
             data (:obj:`dict`): The :attr:`telegram.ext.dispatcher.user_data` [user_id].
         """
-        if self.user_data is None:
-            self.user_data = defaultdict(dict)
-        if self.user_data.get(user_id) == data:
-            return
-        self.user_data[user_id] = data
-        if not self.on_flush:
-            self.database.update_user_data(self.user_data)
+        with self._lock:
+            if self.user_data.get(user_id) == data:
+                return
+            self.user_data[user_id] = deepcopy(data)
+            self._dirty_users.add(user_id)
+        self._changed()
 
     def update_conversation(self, name: str, key: tuple, new_state: int):
         """
         Will update the conversations for the given handler and depending on :attr:`on_flush`
-        save data in the database.
+        schedule writing of the state into the database.
         :param name: The handlers name.
         :param key: The key the state is changed for.
         :param new_state: The new state for the given key.
         """
         # Since, this bot can't be invited into a group, it has just chat_id (as key) and will have no name
-        if self.conversations.setdefault(name, {}).get(key) == new_state:
+        with self._lock:
+            if self.conversations is None:
+                self.conversations = {}
+            if self.conversations.setdefault(name, {}).get(key) == new_state:
+                return
+
+            self.conversations[name][key] = new_state
+            self._dirty_conversations.add((name, key))
+        self._changed()
+
+    def _changed(self):
+        """
+        Schedules writing of the changed rows: they're written when $flush_count rows were changed
+        or $flush_interval seconds passed since the first change.
+        """
+        if self.on_flush:
             return
 
-        self.conversations[name][key] = new_state
+        with self._lock:
+            count = len(self._dirty_chats) + len(self._dirty_users) + len(self._dirty_conversations)
+            write_now = count >= self.flush_count or not self.flush_interval
+            if not write_now and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._write)
+                self._timer.daemon = True
+                self._timer.start()
 
-        if not self.on_flush:
-            self.database.update_conversations(self.conversations)
+        if write_now:
+            self._write()
+
+    def _write(self):
+        """
+        Writes only the changed rows of chats, users and conversations into the database.
+        The rows are taken under the lock, but written without it, so handlers aren't blocked by the database.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+                chats, self._dirty_chats = self._dirty_chats, set()
+                users, self._dirty_users = self._dirty_users, set()
+                conversations, self._dirty_conversations = self._dirty_conversations, set()
+
+                chat_data = {chat_id: self.chat_data[chat_id] for chat_id in chats}
+                user_data = {user_id: self.user_data[user_id] for user_id in users}
+                changed_conversations = defaultdict(dict)
+                for name, key in conversations:
+                    changed_conversations[name][key] = self.conversations[name][key]
+
+            # Chats and users reference conversations, so the conversations are written first, and the rows
+            # which reference them aren't written if they failed. Every table is marked again by itself
+            # so that the rows written successfully aren't written again
+            try:
+                if changed_conversations:
+                    self.database.update_conversations(changed_conversations)
+            except Exception as e:
+                logging.warning(f"The changed conversations weren't written into the database "
+                                f"and will be written later: {e}")
+                with self._lock:
+                    self._dirty_chats |= chats
+                    self._dirty_users |= users
+                    self._dirty_conversations |= conversations
+                return
+
+            try:
+                if chat_data:
+                    self.database.update_chat_data(chat_data)
+            except Exception as e:
+                logging.warning(f"The changed data of chats wasn't written into the database "
+                                f"and will be written later: {e}")
+                with self._lock:
+                    self._dirty_chats |= chats
+
+            try:
+                if user_data:
+                    self.database.update_user_data(user_data)
+            except Exception as e:
+                logging.warning(f"The changed data of users wasn't written into the database "
+                                f"and will be written later: {e}")
+                with self._lock:
+                    self._dirty_users |= users
 
     def flush(self):
-        if self.user_data:
-            self.database.update_user_data(self.user_data)
-        if self.chat_data:
-            self.database.update_chat_data(self.chat_data)
+        self._write()
         if self.bot_data:
             self.database.update_bot_data(self.bot_data)
-        if self.conversations:
-            self.database.update_conversations(self.conversations)
 
-        self.database.connection.close()
+        self.database.close()
 
     def update_bot_data(self, data):
         if self.bot_data is None:
@@ -136,10 +314,7 @@ class BotPersistence(BasePersistence):
             self.database.update_bot_data(self.bot_data)
 
     def get_bot_data(self):
-        if self.user_data:
-            pass
-        else:
-            data = defaultdict(dict)
-            self.user_data = data
+        if self.bot_data is None:
+            self.bot_data = defaultdict(dict)
 
-        return deepcopy(self.user_data)
+        return deepcopy(self.bot_data)
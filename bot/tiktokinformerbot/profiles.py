@@ -0,0 +1,89 @@
+"""
+Module for the cache of lookups of TikTok profiles. A profile is looked up in the in-process cache,
+then in the users table, which the informer keeps updated, and only then it's requested from TikTok.
+"""
+import threading
+import time
+from collections import OrderedDict
+from database.db import Database
+
+
+class ProfileCache:
+    # Time in seconds which existing and missing profiles are considered fresh
+    ttl = 3600
+    missing_ttl = 600
+    # Count of profiles kept in memory
+    size = 10000
+
+    def __init__(self, database: Database, ttl: float = None, missing_ttl: float = None, size: int = None):
+        self.database = database
+        if ttl is not None:
+            self.ttl = ttl
+        if missing_ttl is not None:
+            self.missing_ttl = missing_ttl
+        if size is not None:
+            self.size = size
+
+        # Unique ids of profiles and pairs of whether the profile exists and the time it was checked
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, unique_id: str):
+        """
+        Returns whether the profile exists if it's known and fresh or None otherwise.
+        """
+        with self._lock:
+            entry = self._profiles.get(unique_id)
+            if entry is None:
+                return None
+
+            exists, checked = entry
+            if time.monotonic() - checked > (self.ttl if exists else self.missing_ttl):
+                del self._profiles[unique_id]
+                return None
+
+            self._profiles.move_to_end(unique_id)
+            return exists
+
+    def store(self, unique_id: str, exists: bool):
+        """
+        Remembers whether the profile exists.
+
+        :param unique_id: the name of a profile
+        :param exists: whether the profile exists
+        """
+        with self._lock:
+            self._profiles[unique_id] = (exists, time.monotonic())
+            self._profiles.move_to_end(unique_id)
+            while len(self._profiles) > self.size:
+                self._profiles.popitem(last=False)
+
+    def missing(self, unique_id: str) -> bool:
+        """
+        Returns True if the profile is known to be missing.
+
+        :param unique_id: the name of a profile
+        """
+        return self._get(unique_id) is False
+
+    def exists(self, unique_id: str, fetch) -> bool:
+        """
+        Checks that the profile exists. The network is used only if the profile isn't cached
+        and the users table doesn't contain its fresh copy.
+
+        :param unique_id: the name of a profile
+        :param fetch: function requesting the profile from TikTok and returning whether it exists
+        :return: whether the profile exists
+        """
+        exists = self._get(unique_id)
+        if exists is not None:
+            return exists
+
+        age = self.database.get_user_age(unique_id)
+        if age is not None and age <= self.ttl:
+            exists = True
+        else:
+            exists = fetch(unique_id)
+
+        self.store(unique_id, exists)
+        return exists
@@ -0,0 +1,91 @@
+"""
+Benchmark of the streaming parser of the ranking pages against the BeautifulSoup tree built for a whole page.
+The pages are read from fixture files, which are downloaded once by the --save option.
+It must be run from the informer directory:
+
+    python3 -m benchmarks.parse_top_users fixtures --save 10
+    python3 -m benchmarks.parse_top_users fixtures
+"""
+import argparse
+import os
+import time
+import requests
+from bs4 import BeautifulSoup
+from utils import TOP_USERS_URL, COUNT_ON_PAGE, parse_page
+
+# Counts of names taken from a page
+LIMITS = (10, 50, COUNT_ON_PAGE)
+REPEATS = 20
+# Size of the parts which the streaming parser is fed by, as the response is read
+CHUNK_SIZE = 8192
+
+
+def parse_page_tree(text: str, limit: int) -> list:
+    """
+    The previous way of parsing: the whole page is parsed into a tree and then the names are searched.
+    """
+    bs = BeautifulSoup(text, features='html.parser')
+    return [profile.find('a').get('name') for profile in bs.find_all('td', class_='name')][:limit]
+
+
+def parse_page_stream(text: str, limit: int) -> list:
+    return parse_page((text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)), limit)
+
+
+def save(directory: str, pages: int):
+    """
+    Downloads $pages pages of the ranking into the directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with requests.Session() as session:
+        for page in range(1, pages + 1):
+            response = session.get(TOP_USERS_URL.format(page))
+            response.raise_for_status()
+            with open(os.path.join(directory, f'{page}.html'), 'w', encoding='utf-8') as file:
+                file.write(response.text)
+
+
+def measure(parse, texts: list, limit: int) -> float:
+    """
+    Returns the best time in seconds of parsing of all the pages.
+    """
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        for text in texts:
+            parse(text, limit)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the parsers of the ranking pages')
+    parser.add_argument('directory', help='the directory of the fixture pages')
+    parser.add_argument('--save', type=int, metavar='PAGES', help='download this count of pages into the directory')
+    args = parser.parse_args()
+
+    if args.save:
+        save(args.directory, args.save)
+
+    texts = []
+    for name in sorted(os.listdir(args.directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(args.directory, name), encoding='utf-8') as file:
+                texts.append(file.read())
+    if not texts:
+        raise SystemExit(f'There are no pages in {args.directory}, download them by --save')
+
+    # Both parsers must find the same names
+    for text in texts:
+        assert parse_page_tree(text, COUNT_ON_PAGE) == parse_page_stream(text, COUNT_ON_PAGE)
+
+    print(f"{len(texts)} pages")
+    print(f"{'names':>6} {'tree, ms/page':>14} {'stream, ms/page':>16} {'speedup':>8}")
+    for limit in LIMITS:
+        tree = measure(parse_page_tree, texts, limit) / len(texts)
+        stream = measure(parse_page_stream, texts, limit) / len(texts)
+        print(f"{limit:>6} {tree * 1e3:>14.3f} {stream * 1e3:>16.3f} {tree / stream:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
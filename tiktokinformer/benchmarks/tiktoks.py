@@ -0,0 +1,98 @@
+"""
+Benchmark of the queries of the tiktoks table about a certain creator on growing counts of videos.
+Thanks to the (user_id, time DESC) index and the monthly partitions the latency mustn't grow with the table.
+The rows are added to the table up to each size, so the largest size is seeded once.
+It must be run from the informer directory against a throwaway database, since it rewrites the tables:
+
+    PG_HOST=... PG_PORT=... PG_NAME=... PG_USER=... PG_PASS=... python3 -m benchmarks.tiktoks --sizes 1000000 100000000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from database.db import Database
+
+SIZES = (1000000, 10000000, 100000000)
+REPEATS = 200
+# Count of creators which the videos are spread between
+CREATORS = 10000
+# Period in days which the videos are spread over, until the current time
+PERIOD = 730
+# Count of rows inserted in one transaction
+CHUNK = 1000000
+
+QUERIES = {
+    'last video': "SELECT MAX(time) FROM tiktoks WHERE user_id = %(user_id)s",
+    'last 30 videos': "SELECT id, description, time FROM tiktoks WHERE user_id = %(user_id)s "
+                      "ORDER BY time DESC LIMIT 30",
+    'videos of a month': "SELECT COUNT(*) FROM tiktoks WHERE user_id = %(user_id)s "
+                         "AND time > NOW() - INTERVAL '30 days'",
+}
+
+
+def seed(database: Database, start: int, end: int):
+    """
+    Inserts the videos with ids from $start to $end. The creator and the time of a video are derived from its id,
+    so the rows don't depend on the sizes they're seeded for.
+    """
+    for chunk_start in range(start, end, CHUNK):
+        with database.transaction() as cur:
+            cur.execute("INSERT INTO tiktoks (id, user_id, description, time) "
+                        "SELECT id, 'creator' || (id %% %(creators)s), 'video ' || id, "
+                        "LOCALTIMESTAMP - (id * 7919 %% (%(period)s * 1440)) * INTERVAL '1 minute' "
+                        "FROM generate_series(%(start)s::BIGINT, %(end)s - 1) AS id",
+                        {'creators': CREATORS, 'period': PERIOD, 'start': chunk_start,
+                         'end': min(chunk_start + CHUNK, end)})
+
+    with database.transaction() as cur:
+        cur.execute("ANALYZE tiktoks")
+
+
+def measure(database: Database, query: str, repeats: int) -> list:
+    timings = []
+    with database.transaction() as cur:
+        for _ in range(repeats):
+            parameters = {'user_id': f'creator{random.randrange(CREATORS)}'}
+            started = time.perf_counter()
+            cur.execute(query, parameters)
+            cur.fetchall()
+            timings.append(time.perf_counter() - started)
+    return sorted(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the queries of the tiktoks table about a creator')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='counts of the seeded videos')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='count of calls of every query')
+    args = parser.parse_args()
+
+    database = Database.connect(host=os.getenv('PG_HOST'), port=os.getenv('PG_PORT'),
+                                user=os.getenv('PG_USER'), password=os.getenv('PG_PASS'),
+                                database=os.getenv('PG_NAME'))
+    database.create_partitions(since=datetime.now() - timedelta(days=PERIOD))
+    with database.transaction() as cur:
+        cur.execute("TRUNCATE tiktoks, users CASCADE")
+        cur.execute("INSERT INTO users (unique_id, nickname, followers_cnt, following_cnt, heart_cnt, video_cnt) "
+                    "SELECT 'creator' || id, 'creator ' || id, 0, 0, 0, 0 "
+                    "FROM generate_series(0, %(creators)s - 1) AS id", {'creators': CREATORS})
+
+    print(f"{'videos':>10} {'query':<18} {'median, ms':>11} {'p95, ms':>9}")
+    seeded = 0
+    for size in sorted(args.sizes):
+        started = time.perf_counter()
+        seed(database, seeded, size)
+        seeded = size
+        print(f"{size:>10} seeded in {time.perf_counter() - started:.0f} seconds")
+
+        for name, query in QUERIES.items():
+            timings = measure(database, query, args.repeats)
+            print(f"{size:>10} {name:<18} {statistics.median(timings) * 1e3:>11.3f} "
+                  f"{timings[int(len(timings) * 0.95)] * 1e3:>9.3f}")
+
+    database.close()
+
+
+if __name__ == '__main__':
+    main()
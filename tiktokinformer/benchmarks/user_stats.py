@@ -0,0 +1,95 @@
+"""
+Benchmark of the range queries of the history of statistics which charts of growth of followers are built from.
+The history of the creators is seeded as the informer writes it, a row per hour when the statistics change,
+and Database.get_user_stats is called for groups of creators of several sizes over several periods.
+It must be run from the informer directory against a throwaway database, since it rewrites the tables:
+
+    PG_HOST=... PG_PORT=... PG_NAME=... PG_USER=... PG_PASS=... python3 -m benchmarks.user_stats --creators 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from database.db import Database
+
+CREATORS = 10000
+REPEATS = 20
+# Counts of creators which history is requested at once
+GROUPS = (1, 100, 1000)
+# Periods in days which the history is requested for
+PERIODS = (7, 30, 90)
+# Period in days which the history is seeded for, until the current time
+HISTORY = 90
+
+
+def seed(database: Database, creators: int):
+    """
+    Seeds the history of $creators creators for $HISTORY days with a row per hour. The statistics of a creator
+    grow with the time, and a row is skipped now and then as if the statistics didn't change.
+    """
+    with database.transaction() as cur:
+        cur.execute("TRUNCATE user_stats, user_stats_rollups, users CASCADE")
+        cur.execute("INSERT INTO users (unique_id, nickname, followers_cnt, following_cnt, heart_cnt, video_cnt) "
+                    "SELECT 'creator' || id, 'creator ' || id, 0, 0, 0, 0 "
+                    "FROM generate_series(0, %(creators)s - 1) AS id", {'creators': creators})
+
+    for first in range(0, creators, 1000):
+        with database.transaction() as cur:
+            cur.execute("INSERT INTO user_stats (unique_id, time, followers_cnt, following_cnt, heart_cnt, video_cnt) "
+                        "SELECT 'creator' || id, date_trunc('hour', LOCALTIMESTAMP) - hour * INTERVAL '1 hour', "
+                        "(%(hours)s - hour) * (id %% 100 + 1), 100, (%(hours)s - hour) * 10, (%(hours)s - hour) / 24 "
+                        "FROM generate_series(%(first)s, %(last)s - 1) AS id, "
+                        "generate_series(0, %(hours)s - 1) AS hour "
+                        "WHERE (id + hour) %% 5 <> 0",
+                        {'first': first, 'last': min(first + 1000, creators), 'hours': HISTORY * 24})
+
+    with database.transaction() as cur:
+        cur.execute("ANALYZE user_stats")
+
+
+def measure(database: Database, creators: int, group: int, days: int, repeats: int) -> tuple:
+    """
+    Requests the history of random $group creators for the last $days days $repeats times.
+
+    :return: sorted timings in seconds and the average count of returned points
+    """
+    timings = []
+    points = 0
+    for _ in range(repeats):
+        unique_ids = [f'creator{index}' for index in random.sample(range(creators), min(group, creators))]
+        started = time.perf_counter()
+        history = database.get_user_stats(unique_ids, datetime.now() - timedelta(days=days))
+        timings.append(time.perf_counter() - started)
+        points += sum(len(rows) for rows in history.values())
+    return sorted(timings), points / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the range queries of the history of statistics')
+    parser.add_argument('--creators', type=int, default=CREATORS, help='count of the seeded creators')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help='count of calls of every query')
+    args = parser.parse_args()
+
+    database = Database.connect(host=os.getenv('PG_HOST'), port=os.getenv('PG_PORT'),
+                                user=os.getenv('PG_USER'), password=os.getenv('PG_PASS'),
+                                database=os.getenv('PG_NAME'))
+    database.create_partitions(since=datetime.now() - timedelta(days=HISTORY))
+
+    started = time.perf_counter()
+    seed(database, args.creators)
+    print(f"The history of {args.creators} creators was seeded in {time.perf_counter() - started:.0f} seconds")
+
+    print(f"{'creators':>8} {'days':>5} {'points':>9} {'median, ms':>11} {'p95, ms':>9}")
+    for group in GROUPS:
+        for days in PERIODS:
+            timings, points = measure(database, args.creators, group, days, args.repeats)
+            print(f"{group:>8} {days:>5} {points:>9.0f} {statistics.median(timings) * 1e3:>11.3f} "
+                  f"{timings[int(len(timings) * 0.95)] * 1e3:>9.3f}")
+
+    database.close()
+
+
+if __name__ == '__main__':
+    main()
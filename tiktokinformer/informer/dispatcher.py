@@ -0,0 +1,151 @@
+"""
+Module for sending notifications to Telegram apart from polling of TikTok. Notifications are put into
+a bounded queue and sent by several workers which respect the flood limits of Telegram.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError, Unauthorized
+from informer.metrics import NOTIFY_SECONDS, NOTIFICATIONS, NOTIFICATIONS_QUEUED
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        :param rate: count of tokens added per second
+        :param capacity: maximum count of accumulated tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self):
+        """
+        Takes a token from the bucket, waiting until it's available.
+        """
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    # Maximum count of notifications waiting to be sent
+    queue_size = 10000
+    # Count of notifications sent at the same time
+    workers = 8
+    # Telegram allows about 30 messages per second in total and 1 message per second to the same chat
+    global_rate = 30
+    chat_rate = 1
+    # Count of attempts to send a notification
+    attempts = 5
+    # Count of buckets of chats after which idle buckets are removed
+    max_chat_buckets = 10000
+
+    def __init__(self, bot, workers: int = None):
+        self.bot = bot
+        if workers:
+            self.workers = workers
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self._queue = None
+        self._tasks = []
+        self._global_bucket = TokenBucket(self.global_rate, capacity=self.global_rate)
+        self._chat_buckets = {}
+        # Time until which all the workers wait after Telegram asked to retry later
+        self._paused_until = 0
+
+    def start(self):
+        """
+        Starts the workers in the running event loop.
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def put(self, chat_id: int, text: str):
+        """
+        Puts a notification into the queue. If the queue is full, it waits until there is a place.
+
+        :param chat_id: the id of a chat
+        :param text: the text of the notification
+        """
+        await self._queue.put((chat_id, text))
+        NOTIFICATIONS_QUEUED.set(self._queue.qsize())
+
+    async def join(self):
+        """
+        Waits until all the queued notifications are sent.
+        """
+        await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            NOTIFICATIONS_QUEUED.set(self._queue.qsize())
+            try:
+                await self._send(chat_id, text)
+            except Exception as e:
+                NOTIFICATIONS.labels('failed').inc()
+                logging.warning(f"The notification to the chat {chat_id} wasn't sent: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_buckets and len(self._chat_buckets) >= self.max_chat_buckets:
+            self._chat_buckets = {chat: bucket for chat, bucket in self._chat_buckets.items() if not bucket.full}
+        return self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate))
+
+    async def _send(self, chat_id: int, text: str):
+        """
+        Sends a notification respecting the limits of Telegram. If Telegram asks to retry later,
+        all the workers are paused for the requested time.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.attempts):
+            await self._chat_bucket(chat_id).acquire()
+            await self._global_bucket.acquire()
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+            try:
+                with NOTIFY_SECONDS.time():
+                    await loop.run_in_executor(self.executor, partial(self.bot.sendMessage,
+                                                                      chat_id=chat_id,
+                                                                      text=text,
+                                                                      disable_web_page_preview=True))
+                NOTIFICATIONS.labels('sent').inc()
+                return
+            except RetryAfter as e:
+                NOTIFICATIONS.labels('retried').inc()
+                logging.warning(f"Telegram asked to retry after {e.retry_after} seconds")
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except (BadRequest, Unauthorized) as e:
+                # The chat was deleted, the bot was blocked or the message is wrong, so retries won't help.
+                # BadRequest is a subclass of NetworkError, so it's caught before it
+                NOTIFICATIONS.labels('failed').inc()
+                logging.warning(f"The notification to the chat {chat_id} was rejected: {e}")
+                return
+            except (TimedOut, NetworkError) as e:
+                logging.warning(f"Sending of the notification to the chat {chat_id} was failed: {e}")
+                NOTIFICATIONS.labels('retried').inc()
+                await asyncio.sleep(2 ** attempt)
+
+        NOTIFICATIONS.labels('failed').inc()
+        logging.warning(f"The notification to the chat {chat_id} wasn't sent after {self.attempts} attempts")
@@ -0,0 +1,50 @@
+"""
+Module for the maintenance of the database which is made by the informer or, if the informers are sharded,
+by their supervisor.
+"""
+import logging
+import time
+from database.db import Database
+
+
+class Maintenance:
+    """
+    Creates partitions of the next months and downsamples the old history of statistics once per $interval,
+    and migrates the tables created by the previous versions.
+    """
+    def __init__(self, database: Database, interval: float = None):
+        """
+        :param database: the Database object
+        :param interval: interval in seconds between the maintenances, None disables them
+        """
+        self.database = database
+        self.interval = interval
+        self._last = None
+
+    def run(self):
+        """
+        Maintains the database if $interval passed since the last maintenance.
+        """
+        if not self.interval or (self._last is not None and time.monotonic() - self._last < self.interval):
+            return
+
+        self._last = time.monotonic()
+        try:
+            self.database.create_partitions()
+            deleted = self.database.rollup_user_stats()
+            logging.info(f"{deleted} rows of the history of statistics were downsampled")
+        except Exception as e:
+            logging.warning(f"The maintenance of the database was failed: {e}")
+
+    def migrate(self):
+        """
+        Moves the videos of the table created before the partitioning into the partitioned one.
+        It's run in a thread, since the migration of a large table takes a while.
+        """
+        try:
+            moved = self.database.migrate_tiktoks()
+        except Exception as e:
+            logging.warning(f"The migration of the tiktoks table was failed: {e}")
+            return
+        if moved:
+            logging.info(f"{moved} videos were moved into the partitioned tiktoks table")
@@ -0,0 +1,40 @@
+"""
+Module for the metrics of the informer exposed in the Prometheus text format. The metrics are updated
+by the stages of the pipeline: fetching of the profiles, writing of them into the database and sending
+of the notifications, and they're served by a local HTTP server started by $start.
+"""
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Buckets of latencies in seconds from fast database writes to slow browser requests
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Buckets of the detection lag in seconds: from a minute to a day
+LAG_BUCKETS = (60, 120, 300, 600, 900, 1800, 3600, 7200, 21600, 86400)
+
+FETCH_SECONDS = Histogram('informer_fetch_seconds', 'Time of fetching of a TikTok profile',
+                          ['outcome'], buckets=LATENCY_BUCKETS)
+PERSIST_SECONDS = Histogram('informer_persist_seconds', 'Time of writing of a batch of rows into the database',
+                            buckets=LATENCY_BUCKETS)
+PERSISTED_ROWS = Counter('informer_persisted_rows', 'Count of rows written into the database', ['outcome'])
+NOTIFY_SECONDS = Histogram('informer_notify_seconds', 'Time of sending of a notification to Telegram',
+                           buckets=LATENCY_BUCKETS)
+NOTIFICATIONS = Counter('informer_notifications', 'Count of notifications', ['outcome'])
+NOTIFICATIONS_QUEUED = Gauge('informer_notifications_queued', 'Count of notifications waiting to be sent')
+SWEEP_SECONDS = Histogram('informer_sweep_seconds', 'Time of polling of the profiles which were due at once',
+                          buckets=LATENCY_BUCKETS + (120, 300, 600))
+SWEEP_PROFILES = Counter('informer_sweep_profiles', 'Count of polled profiles')
+DETECTION_LAG_SECONDS = Histogram('informer_detection_lag_seconds',
+                                  'Time between posting of a video and its detection', buckets=LAG_BUCKETS)
+FETCH_RATE = Gauge('informer_fetch_rate', 'The rate of requests to TikTok per second allowed by the governor')
+FETCH_CONCURRENCY = Gauge('informer_fetch_concurrency',
+                          'Count of requests to TikTok at the same time allowed by the governor')
+SCHEDULED_PROFILES = Gauge('informer_scheduled_profiles', 'Count of profiles which are polled', ['lane'])
+
+
+def start(port: int):
+    """
+    Starts the HTTP server of the metrics in a daemon thread. Nothing is started if the port is 0.
+
+    :param port: the port of the server
+    """
+    if port:
+        start_http_server(port)
@@ -0,0 +1,237 @@
+"""
+Module for scheduling polls of TikTok profiles. Each profile is polled as often as it posts videos
+and as many subscribers wait for it, but not more often than $min_interval and not less often than $max_interval.
+Profiles are split into priority lanes by count of subscribers, and each lane gets its own share of the polls
+when more profiles are due than can be polled at once, so the most followed profiles are polled first.
+"""
+import heapq
+import math
+import time
+
+
+class PollScheduler:
+    # Bounds of the interval between two polls of a profile in seconds
+    min_interval = 60
+    max_interval = 3600
+    # Period in days which the posting rate of a profile is computed over
+    window = 14
+    # Minimal counts of subscribers of the lanes, from the highest priority to the lowest
+    lanes = (1000, 50, 0)
+    # Shares of the polls of a sweep given to the lanes, the share unused by a lane is given to the others
+    shares = (0.5, 0.3, 0.2)
+
+    def __init__(self, min_interval: float = None, max_interval: float = None):
+        if min_interval:
+            self.min_interval = min_interval
+        if max_interval:
+            self.max_interval = max_interval
+
+        # Heaps of (time of the next poll, name) of each lane. Entries of removed, rescheduled or moved profiles
+        # stay in the heaps and are skipped when they're popped, because their time or lane differs
+        # from the ones in $_next_polls and $_lanes. The time of a profile which is being polled is None
+        self._queues = [[] for _ in self.lanes]
+        self._next_polls = {}
+        self._last_polls = {}
+        self._intervals = {}
+        self._lanes = {}
+        # Counts of videos during $window known from the last update
+        self._videos = {}
+        # Counts of subscribers known from the additions and the changes of the profiles
+        self._subscribers = {}
+
+    def __len__(self):
+        return len(self._next_polls)
+
+    def __contains__(self, name):
+        return name in self._next_polls
+
+    def lane(self, subscribers: int) -> int:
+        """
+        Returns the index of the lane of a profile, 0 is the highest priority.
+
+        :param subscribers: count of chats subscribed to the profile
+        """
+        for index, minimum in enumerate(self.lanes):
+            if subscribers >= minimum:
+                return index
+        return len(self.lanes) - 1
+
+    def lane_sizes(self) -> list:
+        """
+        Returns counts of profiles in each lane.
+        """
+        sizes = [0] * len(self.lanes)
+        for lane in self._lanes.values():
+            sizes[lane] += 1
+        return sizes
+
+    def interval(self, videos: int, subscribers: int) -> float:
+        """
+        Computes the interval between polls of a profile.
+        A profile is polled several times per the average period between its videos, and the more subscribers
+        it has, the more often it's polled. A profile which hasn't posted anything during $window is polled
+        once per $max_interval.
+
+        :param videos: count of videos posted by the profile during $window
+        :param subscribers: count of chats subscribed to the profile
+        :return: interval in seconds
+        """
+        if not videos:
+            return self.max_interval
+
+        average_period = self.window * 24 * 3600 / videos
+        interval = average_period / (2 * (1 + math.log10(1 + subscribers)))
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def update(self, names: list, videos: dict, subscribers: dict = None):
+        """
+        Synchronizes the scheduled profiles with $names: new profiles are scheduled immediately,
+        missing ones are removed, and intervals of the rest are recomputed with their new posting rates.
+        Lanes of the scheduled profiles aren't changed, they're moved by $set_subscribers.
+
+        :param names: list of unique names of TikTok profiles
+        :param videos: dictionary of names and counts of videos posted during $window
+        :param subscribers: dictionary of names and counts of subscribed chats of the new profiles
+        """
+        subscribers = subscribers or {}
+        now = time.monotonic()
+        names = set(names)
+
+        for name in list(self._next_polls):
+            if name not in names:
+                self.remove(name)
+
+        for name in names:
+            if name not in self._next_polls:
+                self.add(name, videos.get(name, 0), subscribers.get(name, 0))
+                continue
+
+            if self._videos.get(name) == videos.get(name, 0):
+                continue
+            self._videos[name] = videos.get(name, 0)
+            self._intervals[name] = self.interval(self._videos[name], self._subscribers.get(name, 0))
+
+            # Bring the next poll forward if the profile became more active
+            self._bring_forward(name, self._last_polls.get(name, now) + self._intervals[name])
+
+    def add(self, name: str, videos: int = 0, subscribers: int = 0):
+        """
+        Schedules a new profile to be polled immediately.
+
+        :param name: unique name of a TikTok profile
+        :param videos: count of videos posted by the profile during $window
+        :param subscribers: count of chats subscribed to the profile
+        """
+        self._intervals[name] = self.interval(videos, subscribers)
+        self._videos[name] = videos
+        self._subscribers[name] = subscribers
+        self._lanes[name] = self.lane(subscribers)
+        self._schedule(name, time.monotonic())
+
+    def set_subscribers(self, name: str, subscribers: int):
+        """
+        Moves a profile into the lane of its new count of subscribers and recomputes its interval
+        with the posting rate known from the last update.
+
+        :param name: unique name of a TikTok profile
+        :param subscribers: count of chats subscribed to the profile
+        """
+        if name not in self._next_polls or self._subscribers.get(name) == subscribers:
+            return
+
+        self._subscribers[name] = subscribers
+        self._intervals[name] = self.interval(self._videos.get(name, 0), subscribers)
+        self._move(name, self.lane(subscribers))
+
+        self._bring_forward(name, self._last_polls.get(name, time.monotonic()) + self._intervals[name])
+
+    def remove(self, name: str):
+        """
+        Stops polling of a profile.
+
+        :param name: unique name of a TikTok profile
+        """
+        self._next_polls.pop(name, None)
+        self._last_polls.pop(name, None)
+        self._intervals.pop(name, None)
+        self._lanes.pop(name, None)
+        self._videos.pop(name, None)
+        self._subscribers.pop(name, None)
+
+    def pop_due(self, limit: int = None) -> list:
+        """
+        Removes the profiles which must be polled now from the queue.
+        They must be returned into the queue by $reschedule after they were polled.
+        If $limit is passed, each lane gives at most its share of $limit profiles, and then the rest of $limit
+        is filled by the lanes in the order of their priority.
+
+        :param limit: maximum count of profiles
+        :return: list of unique names of TikTok profiles
+        """
+        now = time.monotonic()
+        if limit is None:
+            return [name for lane in range(len(self.lanes)) for name in self._pop_lane(lane, now)]
+
+        names = []
+        for lane, share in enumerate(self.shares):
+            names.extend(self._pop_lane(lane, now, min(math.ceil(share * limit), limit - len(names))))
+        for lane in range(len(self.lanes)):
+            names.extend(self._pop_lane(lane, now, limit - len(names)))
+        return names
+
+    def _pop_lane(self, lane: int, now: float, count: int = None) -> list:
+        """
+        Removes at most $count due profiles from the queue of the lane.
+        """
+        queue = self._queues[lane]
+        names = []
+        while queue and queue[0][0] <= now and (count is None or len(names) < count):
+            next_poll, name = heapq.heappop(queue)
+            if self._next_polls.get(name) == next_poll and self._lanes.get(name) == lane:
+                self._next_polls[name] = None
+                names.append(name)
+        return names
+
+    def reschedule(self, name: str):
+        """
+        Schedules the next poll of a profile after it was polled.
+
+        :param name: unique name of a TikTok profile
+        """
+        if name not in self._next_polls:
+            return
+
+        now = time.monotonic()
+        self._last_polls[name] = now
+        self._schedule(name, now + self._intervals.get(name, self.max_interval))
+
+    def delay(self) -> float:
+        """
+        Returns count of seconds until the next poll or $max_interval if there are no profiles.
+
+        :return: seconds
+        """
+        next_polls = []
+        for lane, queue in enumerate(self._queues):
+            while queue and (self._next_polls.get(queue[0][1]) != queue[0][0] or self._lanes.get(queue[0][1]) != lane):
+                heapq.heappop(queue)
+            if queue:
+                next_polls.append(queue[0][0])
+
+        if not next_polls:
+            return self.max_interval
+        return max(min(next_polls) - time.monotonic(), 0)
+
+    def _bring_forward(self, name: str, next_poll: float):
+        if self._next_polls[name] is not None and next_poll < self._next_polls[name]:
+            self._schedule(name, next_poll)
+
+    def _move(self, name: str, lane: int):
+        if self._lanes.get(name) != lane:
+            self._lanes[name] = lane
+            if self._next_polls[name] is not None:
+                heapq.heappush(self._queues[lane], (self._next_polls[name], name))
+
+    def _schedule(self, name: str, next_poll: float):
+        self._next_polls[name] = next_poll
+        heapq.heappush(self._queues[self._lanes[name]], (next_poll, name))
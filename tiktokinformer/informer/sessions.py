@@ -0,0 +1,246 @@
+"""
+Module for the pool of warm browser sessions of TikTokApi. TikTokApi allows only one instance per process,
+so each session is a separate process with its own instance and browser. Sessions are recycled after
+a count of requests or when the memory used by the process and its browser exceeds the limit.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from TikTokApi import TikTokApi
+from TikTokApi.exceptions import TikTokNotFoundError
+
+
+def serve(connection):
+    """
+    The entrypoint of a session process: it receives names of profiles and sends back the profiles.
+    The first message tells that the browser is started.
+
+    :param connection: the end of the pipe connected to the pool
+    """
+    api = TikTokApi.get_instance(use_selenium=True)
+    connection.send(('ready', None))
+
+    while True:
+        username = connection.recv()
+        if username is None:
+            break
+
+        try:
+            connection.send(('ok', api.getUser(username=username)))
+        except TikTokNotFoundError:
+            connection.send(('not_found', None))
+        except Exception as e:
+            connection.send(('error', repr(e)))
+
+
+def get_rss(pid: int) -> int:
+    """
+    Returns the resident memory in bytes used by the process and all its descendants, such as the browser.
+
+    :param pid: the id of a process
+    """
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as file:
+                # The name of the process is in parentheses and may contain spaces
+                ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    rss, pids = 0, [pid]
+    while pids:
+        current = pids.pop()
+        pids.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/statm') as file:
+                rss += int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss
+
+
+class SessionError(Exception):
+    pass
+
+
+class BrowserSession:
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child,))
+        self.process.start()
+        self.requests = 0
+
+    def wait_ready(self, timeout: float):
+        """
+        Waits until the browser of the session is started.
+        """
+        if not self.connection.poll(timeout):
+            raise SessionError("The browser session wasn't started in time")
+        self.connection.recv()
+
+    def get_user(self, username: str, timeout: float) -> dict:
+        """
+        Requests the profile through the session.
+
+        :raises TikTokNotFoundError: if the profile doesn't exist
+        :raises SessionError: if the session didn't answer in time or the request was failed
+        """
+        self.requests += 1
+        self.connection.send(username)
+        if not self.connection.poll(timeout):
+            raise SessionError(f"The browser session didn't answer in {timeout} seconds")
+
+        status, result = self.connection.recv()
+        if status == 'not_found':
+            raise TikTokNotFoundError(username)
+        if status == 'error':
+            raise SessionError(result)
+        return result
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def rss(self) -> int:
+        return get_rss(self.process.pid)
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+class SessionPool:
+    # Count of sessions
+    size = 2
+    # Count of requests and resident memory in bytes after which a session is recycled
+    max_requests = 500
+    max_rss = 1024 ** 3
+    # Count of requests after which memory of a session is checked
+    rss_check_interval = 20
+    # Timeouts in seconds of starting a session and of a request
+    start_timeout = 120
+    request_timeout = 60
+
+    def __init__(self, size: int = None, max_requests: int = None, max_rss: int = None):
+        if size:
+            self.size = size
+        if max_requests:
+            self.max_requests = max_requests
+        if max_rss:
+            self.max_rss = max_rss
+
+        # Sessions are spawned to not copy connections of the parent process
+        self.context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._sessions = set()
+        self._statistics = {'checkouts': 0, 'recycles': 0, 'wait': 0}
+
+        for _ in range(self.size):
+            self._idle.put(self._start_session())
+
+    def _start_session(self) -> BrowserSession:
+        session = BrowserSession(self.context)
+        try:
+            session.wait_ready(self.start_timeout)
+        except Exception:
+            session.close()
+            raise
+
+        with self._lock:
+            self._sessions.add(session)
+        return session
+
+    @contextmanager
+    def session(self):
+        """
+        Checks out an idle session, waiting until one of them is returned, and returns it back after the block.
+        A session which failed is replaced by a new one.
+        """
+        started = time.monotonic()
+        try:
+            session = self._idle.get(timeout=self.request_timeout)
+        except queue.Empty:
+            raise SessionError(f"No browser session was free for {self.request_timeout} seconds")
+        with self._lock:
+            self._statistics['checkouts'] += 1
+            self._statistics['wait'] += time.monotonic() - started
+
+        broken = False
+        try:
+            yield session
+        except SessionError:
+            broken = True
+            raise
+        finally:
+            self._return(session, broken)
+
+    def _return(self, session: BrowserSession, broken: bool):
+        """
+        Returns the session into the pool or replaces it by a new one if it must be recycled.
+        """
+        recycle = broken or not session.alive or session.requests >= self.max_requests
+        if not recycle and session.requests % self.rss_check_interval == 0:
+            recycle = session.rss() > self.max_rss
+
+        if not recycle:
+            self._idle.put(session)
+            return
+
+        with self._lock:
+            self._sessions.discard(session)
+            self._statistics['recycles'] += 1
+        session.close()
+
+        try:
+            self._idle.put(self._start_session())
+        except Exception as e:
+            logging.warning(f"The browser session wasn't restarted: {e}")
+            # The pool mustn't shrink, so the session is started again later
+            threading.Timer(self.start_timeout, self._restart).start()
+
+    def _restart(self):
+        try:
+            self._idle.put(self._start_session())
+        except Exception as e:
+            logging.warning(f"The browser session wasn't restarted: {e}")
+            threading.Timer(self.start_timeout, self._restart).start()
+
+    def get_user(self, username: str) -> dict:
+        with self.session() as session:
+            return session.get_user(username, self.request_timeout)
+
+    def stats(self) -> dict:
+        """
+        Returns count of sessions, count of idle ones, count of checkouts and recycles,
+        the average time of waiting for a session in seconds and the memory used by all the sessions in bytes.
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+            statistics = dict(self._statistics)
+
+        statistics['sessions'] = len(sessions)
+        statistics['idle'] = self._idle.qsize()
+        statistics['wait'] = statistics['wait'] / statistics['checkouts'] if statistics['checkouts'] else 0
+        statistics['rss'] = sum(session.rss() for session in sessions if session.alive)
+        return statistics
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), set()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,140 @@
+"""
+Module for the in-memory index of chats subscribed to tiktokers and the cursor of the log of its changes.
+"""
+import time
+from array import array
+from bisect import bisect_left
+
+
+class SubscriberIndex:
+    """
+    Index of unique ids of tiktokers and chats subscribed to them. Ids of chats are kept
+    in sorted arrays of 64-bit integers, so a subscription takes 8 bytes of memory.
+    """
+    def __init__(self):
+        self._chats = {}
+
+    def __len__(self):
+        return sum(len(chats) for chats in self._chats.values())
+
+    def __contains__(self, unique_id):
+        return unique_id in self._chats
+
+    def __iter__(self):
+        return iter(self._chats)
+
+    def build(self, subscriptions):
+        """
+        Replaces the content of the index.
+
+        :param subscriptions: iterable of pairs of a unique id and a chat id
+        """
+        chats = {}
+        for unique_id, chat_id in subscriptions:
+            chats.setdefault(unique_id, array('q')).append(chat_id)
+
+        for chat_ids in chats.values():
+            if any(chat_ids[i] > chat_ids[i + 1] for i in range(len(chat_ids) - 1)):
+                chat_ids[:] = array('q', sorted(chat_ids))
+        self._chats = chats
+
+    def add(self, unique_id: str, chat_id: int):
+        """
+        Adds a subscription of a chat to a tiktoker.
+
+        :return: True if the subscription wasn't in the index
+        """
+        chat_ids = self._chats.setdefault(unique_id, array('q'))
+        index = bisect_left(chat_ids, chat_id)
+        if index < len(chat_ids) and chat_ids[index] == chat_id:
+            return False
+
+        chat_ids.insert(index, chat_id)
+        return True
+
+    def discard(self, unique_id: str, chat_id: int):
+        """
+        Removes a subscription of a chat to a tiktoker.
+
+        :return: True if the subscription was in the index
+        """
+        chat_ids = self._chats.get(unique_id)
+        if chat_ids is None:
+            return False
+
+        index = bisect_left(chat_ids, chat_id)
+        if index == len(chat_ids) or chat_ids[index] != chat_id:
+            return False
+
+        del chat_ids[index]
+        if not chat_ids:
+            del self._chats[unique_id]
+        return True
+
+    def chats(self, unique_id: str):
+        """
+        Returns ids of chats subscribed to a tiktoker.
+
+        :param unique_id: the nickname of a tiktoker
+        :return: an array of chat ids
+        """
+        return self._chats.get(unique_id, ())
+
+    def counts(self) -> dict:
+        """
+        Returns counts of chats subscribed to each tiktoker.
+
+        :return: a dictionary of unique ids and counts of chats
+        """
+        return {unique_id: len(chat_ids) for unique_id, chat_ids in self._chats.items()}
+
+
+class ChangesCursor:
+    """
+    Position in the log of changes of the favourite users table. Numbers of changes are allocated
+    before the transactions are committed, so a change may appear after the changes with greater numbers.
+    The numbers skipped by the cursor are read again until they appear or $gap_lifetime passes,
+    since the numbers of rolled back transactions never appear.
+    """
+    # Time in seconds which a skipped number of a change is waited for
+    gap_lifetime = 60
+
+    def __init__(self, seq: int = 0, gap_lifetime: float = None):
+        """
+        :param seq: the number of the last read change
+        :param gap_lifetime: time in seconds which a skipped number of a change is waited for
+        """
+        self.seq = seq
+        if gap_lifetime is not None:
+            self.gap_lifetime = gap_lifetime
+        # Skipped numbers and the times when they were skipped
+        self.gaps = {}
+
+    def read(self, database) -> list:
+        """
+        Reads the changes made after the cursor and the skipped ones which have appeared since the last read.
+
+        :param database: the Database object
+        :return: a list of tuples (number of a change, unique id, chat id, whether the row was deleted)
+        """
+        changes = database.get_subscriptions_changes(self.seq, list(self.gaps))
+
+        now = time.monotonic()
+        for seq, *_ in changes:
+            if seq in self.gaps:
+                del self.gaps[seq]
+            elif seq > self.seq:
+                self.gaps.update((skipped, now) for skipped in range(self.seq + 1, seq))
+                self.seq = seq
+
+        self.gaps = {seq: skipped for seq, skipped in self.gaps.items() if now - skipped < self.gap_lifetime}
+        return changes
+
+    def reset(self, seq: int):
+        """
+        Moves the cursor to the change, the skipped numbers are forgotten.
+
+        :param seq: the number of the last read change
+        """
+        self.seq = seq
+        self.gaps = {}
@@ -0,0 +1,208 @@
+"""
+Module to run several informers in separate processes. Each of the processes polls its own part
+of the favourite users, and the supervisor keeps these parts balanced and the processes alive.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from informer.tiktokinformer import TikTokInformer
+from informer.subscribers import ChangesCursor, SubscriberIndex
+from informer.fetchers import get_fetcher
+from informer.maintenance import Maintenance
+from informer import metrics
+from database.db import Database
+from telegram.ext import Updater
+from utils import get_sublists
+
+
+class ShardedInformer(TikTokInformer):
+    def __init__(self, names_queue: multiprocessing.Queue, *args, **kwargs):
+        super(ShardedInformer, self).__init__(*args, **kwargs)
+        self.names_queue = names_queue
+        # The database is maintained by the supervisor
+        self.maintenance = None
+        # The last part of the favourite users received from the supervisor and not applied yet
+        self._received_names = None
+
+    async def run(self):
+        """
+        Runs the loop of the informer along with a thread receiving the parts of the favourite users.
+        """
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._receive_names, args=(loop,), daemon=True).start()
+        await super(ShardedInformer, self).run()
+
+    def _receive_names(self, loop: asyncio.AbstractEventLoop):
+        """
+        Waits for the parts of the favourite users sent by the supervisor
+        and wakes up the loop, so new profiles are polled right away.
+        """
+        while True:
+            names = self.names_queue.get()
+            loop.call_soon_threadsafe(self._set_names, names)
+
+    def _set_names(self, names: list):
+        self._received_names = names
+        self._changed.set()
+
+    def _get_names(self) -> list:
+        """
+        Returns the last part of the favourite users sent by the supervisor.
+        If the supervisor hasn't sent anything new, the previous part is returned.
+
+        :return: list of unique names of TikTok profiles
+        """
+        if self._received_names is not None:
+            self.names, self._received_names = self._received_names, None
+        return self.names
+
+    def _apply_changes(self):
+        """
+        Applies the changes of the subscriptions and the part of the favourite users received from the supervisor.
+        """
+        super(ShardedInformer, self)._apply_changes()
+        if self._received_names is None:
+            return
+
+        previous = set(self.names)
+        names = set(self._get_names())
+        for name in names - previous:
+            self.scheduler.add(name, subscribers=len(self.subscribers.chats(name)))
+        for name in previous - names:
+            self.scheduler.remove(name)
+
+    def _on_subscriptions_changed(self, added: set, removed: set):
+        """
+        Stops polling of the profiles which lost the last subscriber, unless they're seeded.
+        New profiles are polled when the supervisor sends them.
+        """
+        for name in removed - self.seed_names:
+            self.scheduler.remove(name)
+
+
+def run_worker(names_queue: multiprocessing.Queue, credentials: dict, token: str, backend: str,
+               fetch_options: dict, metrics_port: int, parameters: dict):
+    """
+    The entrypoint of a worker process.
+
+    :param names_queue: the queue which the supervisor sends parts of the favourite users into
+    :param credentials: the keyword arguments of Database.connect
+    :param token: the token of the bot
+    :param backend: the name of the backend requesting TikTok profiles
+    :param fetch_options: the keyword arguments of the backend
+    :param metrics_port: the port of the HTTP server of the metrics of the worker, 0 disables it
+    :param parameters: the keyword arguments of TikTokInformer
+    """
+    metrics.start(metrics_port)
+    database = Database.connect(**credentials)
+    updater = Updater(token=token)
+    fetcher = get_fetcher(backend, **fetch_options)
+    informer = ShardedInformer(names_queue, database=database, bot=updater.bot, fetcher=fetcher, **parameters)
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(informer.run())
+
+
+class Supervisor:
+    # Interval in seconds between checks of the subscriptions and of the workers
+    interval = 60
+
+    def __init__(self, workers: int, credentials: dict, token: str, backend: str, fetch_options: dict = None,
+                 metrics_port: int = 0, **parameters):
+        """
+        :param workers: count of worker processes
+        :param credentials: the keyword arguments of Database.connect
+        :param token: the token of the bot
+        :param backend: the name of the backend requesting TikTok profiles
+        :param fetch_options: the keyword arguments of the backend
+        :param metrics_port: the port after which the workers serve their metrics on the next ports, 0 disables them
+        :param parameters: the keyword arguments of TikTokInformer passed to each worker
+        """
+        self.workers = workers
+        self.credentials = credentials
+        self.token = token
+        self.backend = backend
+        self.fetch_options = fetch_options or {}
+        self.metrics_port = metrics_port
+        self.parameters = parameters
+        self.database = Database.connect(**credentials)
+        maintenance_interval = parameters.get('maintenance_interval')
+        if maintenance_interval is None:
+            maintenance_interval = TikTokInformer.maintenance_interval
+        self.maintenance = Maintenance(self.database, interval=maintenance_interval)
+        self.subscribers = SubscriberIndex()
+        self.changes = ChangesCursor()
+        self._loaded = False
+
+        # Workers are spawned to not share the connection to the database with the supervisor
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = [None] * workers
+        self.queues = [None] * workers
+        self.shards = [[] for _ in range(workers)]
+
+    def run(self):
+        """
+        Runs a loop that rebalances the favourite users between the workers, restarts crashed workers
+        and maintains the database.
+        """
+        threading.Thread(target=self.maintenance.migrate, daemon=True).start()
+        try:
+            while True:
+                self._rebalance()
+                self._check_workers()
+                self.maintenance.run()
+                time.sleep(self.interval)
+        finally:
+            for process in self.processes:
+                if process is not None:
+                    process.terminate()
+
+    def _rebalance(self):
+        """
+        Applies the changes of the subscriptions, splits the favourite and the seeded users between the workers
+        and sends new parts to the workers which parts were changed.
+        """
+        # The index is built from the favourite users table once and then follows the log of its changes
+        if not self._loaded:
+            self.changes.reset(self.database.get_subscriptions_cursor())
+            self.subscribers.build(self.database.iter_subscriptions())
+            self._loaded = True
+
+        for seq, unique_id, chat_id, deleted in self.changes.read(self.database):
+            if deleted:
+                self.subscribers.discard(unique_id, chat_id)
+            else:
+                self.subscribers.add(unique_id, chat_id)
+
+        names = sorted(set(self.database.get_seed_users()).union(self.subscribers))
+        shards = [shard for shard in get_sublists(names, self.workers) if shard]
+        shards.extend([] for _ in range(self.workers - len(shards)))
+
+        for index, shard in enumerate(shards):
+            if shard == self.shards[index]:
+                continue
+            self.shards[index] = shard
+            if self.queues[index] is not None:
+                self.queues[index].put(shard)
+
+    def _check_workers(self):
+        """
+        Starts the workers which haven't been started yet or have been crashed.
+        """
+        for index, process in enumerate(self.processes):
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logging.warning(f"The worker {index} was stopped with the code {process.exitcode} and will be restarted")
+
+            # The queue of a crashed worker might be broken, so a new one is created
+            self.queues[index] = self.context.Queue()
+            self.queues[index].put(self.shards[index])
+            self.processes[index] = self.context.Process(target=run_worker,
+                                                         args=(self.queues[index], self.credentials,
+                                                               self.token, self.backend, self.fetch_options,
+                                                               self.metrics_port and self.metrics_port + index + 1,
+                                                               self.parameters))
+            self.processes[index].start()
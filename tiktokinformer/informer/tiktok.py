@@ -2,24 +2,27 @@ from datetime import datetime as dt
 
 
 class Tiktok:
+    # Fields are read from the dictionary of the video when they're accessed, the time is converted once
+    __slots__ = ('_tiktok_dict', '_time')
+
     def __init__(self, tiktok_dict: dict):
-        self._id = tiktok_dict['id']
-        self._desc = tiktok_dict['desc']
-        self._time = dt.fromtimestamp(tiktok_dict['createTime'])
-        self._user_id = tiktok_dict['author']['uniqueId']
+        self._tiktok_dict = tiktok_dict
+        self._time = None
 
     @property
     def id(self):
-        return self._id
+        return self._tiktok_dict['id']
 
     @property
     def desc(self):
-        return self._desc
+        return self._tiktok_dict['desc']
 
     @property
     def time(self):
+        if self._time is None:
+            self._time = dt.fromtimestamp(self._tiktok_dict['createTime'])
         return self._time
 
     @property
     def user_id(self):
-        return self._user_id
+        return self._tiktok_dict['author']['uniqueId']
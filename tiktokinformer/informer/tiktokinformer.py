@@ -1,8 +1,18 @@
+import asyncio
 import logging
+import threading
 import time
-from TikTokApi import TikTokApi
+from concurrent.futures import ThreadPoolExecutor
 from informer.user import User
 from informer.tiktok import Tiktok
+from informer.scheduler import PollScheduler
+from informer.dispatcher import NotificationDispatcher
+from informer.subscribers import ChangesCursor, SubscriberIndex
+from informer.profiles import ProfileCache
+from informer.maintenance import Maintenance
+from informer.fetchers import Fetcher, ProfileNotFoundError
+from informer.metrics import FETCH_SECONDS, SWEEP_SECONDS, SWEEP_PROFILES, DETECTION_LAG_SECONDS, SCHEDULED_PROFILES, \
+    FETCH_RATE, FETCH_CONCURRENCY
 from database.db import Database
 from datetime import datetime, timedelta
 
@@ -11,59 +21,351 @@ logging.basicConfig(format='[%(asctime)s]: %(message)s\n',
 
 
 class TikTokInformer:
-    # Timeout of requests in seconds
+    # Interval in seconds between updates of statistics of the profiles
     timeout = 300
+    # Count of profiles which are fetched at the same time
+    concurrency = 8
+    # Time in seconds after which a fetch of a profile is abandoned
+    fetch_timeout = 60
+    # Count of days which changes of the subscriptions are kept in the database
+    changes_lifetime = 1
+    # Maximum count of profiles polled at once, it's split between the priority lanes of the scheduler
+    sweep_size = 100
+    # Interval in seconds between creations of the next partitions and rollups of the history
+    # of statistics of the profiles, None disables them
+    maintenance_interval = 3600
+    # Videos of a profile which count of videos hasn't changed are looked through once per this count of polls
+    scan_polls = 10
 
-    def __init__(self, database: Database, bot):
+    def __init__(self, database: Database, bot, fetcher: Fetcher,
+                 concurrency: int = None,
+                 sweep_size: int = None,
+                 min_interval: float = None,
+                 max_interval: float = None,
+                 batch_size: int = None,
+                 batch_window: float = None,
+                 notification_workers: int = None,
+                 profiles_ttl: float = None,
+                 missing_profiles_ttl: float = None,
+                 maintenance_interval: float = None):
         self.database = database
         self.names = []
         self.bot = bot
-        self.api = TikTokApi.get_instance(use_selenium=True)
+        self.fetcher = fetcher
         self.last_timestamps = {}
+        # Counts of videos of the profiles confirmed by their last scans and counts of polls since the scans
+        self.video_counts = {}
+        self.skipped_scans = {}
+        # The last statistics of the profiles stored into the history
+        self.user_stats = {}
+        self.scheduler = PollScheduler(min_interval=min_interval, max_interval=max_interval)
+        # The batch lives between the sweeps, so the rows which weren't written are retried by the next one
+        self.batch = database.batch(size=batch_size, window=batch_window)
+        self.dispatcher = NotificationDispatcher(bot, workers=notification_workers)
+        self.subscribers = SubscriberIndex()
+        # Profiles polled without subscribers
+        self.seed_names = set()
+        self.profiles = ProfileCache(database, ttl=profiles_ttl, missing_ttl=missing_profiles_ttl)
+        self.changes = ChangesCursor()
+        self._changed = asyncio.Event()
+        self._listener = None
 
-    def run(self):
+        if concurrency:
+            self.concurrency = concurrency
+        if sweep_size:
+            self.sweep_size = sweep_size
+        if maintenance_interval is not None:
+            self.maintenance_interval = maintenance_interval
+        self.maintenance = Maintenance(database, interval=self.maintenance_interval)
+        # More fetches than the backend makes at the same time would wait for it within their timeout
+        if fetcher.concurrency:
+            self.concurrency = min(self.concurrency, fetcher.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        # Fetches wait for a free thread of the executor before their timeout starts
+        self._fetch_slots = asyncio.Semaphore(self.concurrency)
+
+        # The limits of the governor are read when the metrics are collected
+        if fetcher.governor is not None:
+            FETCH_RATE.set_function(lambda: fetcher.governor.rate)
+            FETCH_CONCURRENCY.set_function(lambda: int(fetcher.governor.concurrency))
+
+    async def run(self):
         """
-        Runs a loop that creates tasks and waits when they will be finished.
+        Runs a loop that polls the profiles when the scheduler says they're due
+        and applies changes of the subscriptions as soon as they're made.
         """
+        self.dispatcher.start()
+        if self.maintenance is not None:
+            threading.Thread(target=self.maintenance.migrate, daemon=True).start()
+        self.last_timestamps = self.database.get_watermarks()
+        self.user_stats = self.database.get_current_user_stats()
+        self._load_subscriptions()
+
+        last_update = None
         while True:
-            self.names = self.database.get_favourite_users()
+            if last_update is None or time.monotonic() - last_update >= self.timeout:
+                self._update_schedule()
+                last_update = time.monotonic()
+            elif self._changed.is_set():
+                self._apply_changes()
+
+            names = self.scheduler.pop_due(self.sweep_size)
+            if names:
+                with SWEEP_SECONDS.time():
+                    await self._load_profiles(names)
+                SWEEP_PROFILES.inc(len(names))
+                for name in names:
+                    self.scheduler.reschedule(name)
+            for lane, size in enumerate(self.scheduler.lane_sizes()):
+                SCHEDULED_PROFILES.labels(lane).set(size)
+
+            time_to_update = last_update + self.timeout - time.monotonic()
+            try:
+                await asyncio.wait_for(self._changed.wait(),
+                                       timeout=max(min(self.scheduler.delay(), time_to_update), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def _update_schedule(self):
+        """
+        Applies the changes of the subscriptions in case notifications about them were lost, and updates the list
+        of profiles and their posting rates and counts of subscribers in the scheduler.
+        """
+        self._listen()
+        self._apply_changes()
+        self.database.delete_subscriptions_changes(self.changes_lifetime)
+
+        stats = self.fetcher.stats()
+        logging.info(f"Profiles were requested {stats['requests']} times, {stats['failures']} of them failed, "
+                     f"a request took {stats['average']:.3f} seconds on average")
+        if 'governor_rate' in stats:
+            logging.info(f"The governor allows {stats['governor_rate']:.2f} requests per second "
+                         f"and {stats['governor_concurrency']} requests at the same time")
+        if 'pool_sessions' in stats:
+            logging.info(f"The pool has {stats['pool_sessions']} browser sessions, {stats['pool_idle']} of them are idle, "
+                         f"they were recycled {stats['pool_recycles']} times and use {stats['pool_rss'] // 1024 ** 2} MB")
+
+        self.seed_names = set(self.database.get_seed_users())
+        self.names = self._get_names()
+        # The scheduled profiles are moved between the lanes when their subscriptions change
+        self.scheduler.update(self.names,
+                              videos=self.database.get_posting_counts(self.scheduler.window),
+                              subscribers={name: len(self.subscribers.chats(name))
+                                           for name in self.names if name not in self.scheduler})
+        self.video_counts = {name: count for name, count in self.video_counts.items() if name in self.scheduler}
+        self.skipped_scans = {name: count for name, count in self.skipped_scans.items() if name in self.scheduler}
+        self.user_stats = {name: stats for name, stats in self.user_stats.items() if name in self.scheduler}
+        if self.maintenance is not None:
+            self.maintenance.run()
+
+    def _load_subscriptions(self):
+        """
+        Builds the index of subscribers from the favourite users table. The changes made after that are read
+        from the log of changes, which is started from the change made before the table was read.
+        """
+        self.changes.reset(self.database.get_subscriptions_cursor())
+        self.subscribers.build(self.database.iter_subscriptions())
+
+    def _listen(self):
+        """
+        Subscribes to notifications about changes of the subscriptions if it wasn't done or the connection was lost.
+        """
+        if self._listener is not None:
+            return
+
+        try:
+            self._listener = self.database.listen('favourite_users')
+        except Exception as e:
+            logging.warning(f"Listening to changes of the subscriptions was failed: {e}")
+            return
 
-            if not self.names:
-                time.sleep(self.timeout)
-                continue
+        asyncio.get_running_loop().add_reader(self._listener, self._receive_notifications)
 
-            self._load_profiles(self.names)
+    def _receive_notifications(self):
+        """
+        Reads notifications from the connection and wakes up the loop to apply the changes.
+        """
+        try:
+            self._listener.poll()
+            self._listener.notifies.clear()
+        except Exception as e:
+            logging.warning(f"Connection listening to changes of the subscriptions was lost: {e}")
+            asyncio.get_running_loop().remove_reader(self._listener)
+            self._listener.close()
+            self._listener = None
+        self._changed.set()
 
-    def _load_profiles(self, names: list):
+    def _apply_changes(self):
+        """
+        Applies the changes of the subscriptions made after the last applied one to the index of subscribers
+        and moves the profiles which counts of subscribers were changed into their lanes.
         """
-        Makes a request to TikTok for certain profiles and insert information about it
-        and its videos into the database.
+        self._changed.clear()
+
+        added, removed, changed = set(), set(), set()
+        for seq, unique_id, chat_id, deleted in self.changes.read(self.database):
+            changed.add(unique_id)
+            if deleted:
+                self.subscribers.discard(unique_id, chat_id)
+                if unique_id not in self.subscribers:
+                    removed.add(unique_id)
+                    added.discard(unique_id)
+            else:
+                if unique_id not in self.subscribers:
+                    added.add(unique_id)
+                    removed.discard(unique_id)
+                self.subscribers.add(unique_id, chat_id)
+
+        if added or removed:
+            self._on_subscriptions_changed(added, removed)
+
+        for name in changed - added:
+            self.scheduler.set_subscribers(name, len(self.subscribers.chats(name)))
+
+    def _on_subscriptions_changed(self, added: set, removed: set):
+        """
+        Starts polling of the profiles which got their first subscriber and stops polling of the profiles
+        which lost the last one, unless they're seeded.
+
+        :param added: set of unique names of TikTok profiles
+        :param removed: set of unique names of TikTok profiles
+        """
+        for name in added:
+            self.scheduler.add(name, subscribers=len(self.subscribers.chats(name)))
+        for name in removed - self.seed_names:
+            self.scheduler.remove(name)
+        self.names = self._get_names()
+
+    def _get_names(self) -> list:
+        """
+        Returns names of the profiles which must be polled.
+
+        :return: list of unique names of TikTok profiles
+        """
+        return list(self.seed_names.union(self.subscribers))
+
+    async def _fetch_profile(self, name: str):
+        """
+        Makes a request to TikTok for a certain profile in the executor.
+        The dictionary is None if the request was failed or took longer than $fetch_timeout.
+
+        :param name: unique name of a TikTok profile
+        :return: tuple of the name and the dictionary of the profile
+        """
+        # Profiles which don't exist aren't requested again until the cache forgets them
+        if self.profiles.missing(name):
+            return name, None
+
+        loop = asyncio.get_running_loop()
+        # The timeout starts when a thread of the executor is free and the governor lets the request through,
+        # so it doesn't count the waiting in the queue
+        async with self._fetch_slots:
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                await loop.run_in_executor(self.executor, self.fetcher.acquire)
+                started = time.perf_counter()
+                user_dict = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, self.fetcher.get_user, name, True),
+                    timeout=self.fetch_timeout)
+                outcome = 'ok'
+            except ProfileNotFoundError:
+                outcome = 'not_found'
+                logging.warning(f"The profile @{name} doesn't exist")
+                self.profiles.store(name, False)
+                return name, None
+            except asyncio.TimeoutError:
+                outcome = 'timeout'
+                logging.warning(f"Fetching of the profile @{name} was timed out")
+                return name, None
+            except Exception as e:
+                logging.warning(f"Fetching of the profile @{name} was failed: {e}")
+                return name, None
+            finally:
+                FETCH_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+
+        self.profiles.store(name, True)
+        return name, user_dict
+
+    async def _load_profiles(self, names: list):
+        """
+        Makes requests to TikTok for certain profiles concurrently and insert information about it
+        and its videos into the database as soon as each of them is received.
+        The rows are written in batches.
 
         :param names: list of unique names of TikTok profiles
         """
-        for name in names:
-            user_dict = self.api.getUser(username=name)
-            user = User(user_dict)
-            self.database.add_user(user)
+        tasks = [self._fetch_profile(name) for name in names]
+
+        with self.batch as batch:
+            for future in asyncio.as_completed(tasks):
+                name, user_dict = await future
+                if user_dict is None:
+                    continue
+                await self._process_profile(name, user_dict, batch)
+
+    async def _process_profile(self, name: str, user_dict: dict, batch):
+        """
+        Adds information about a profile and its new videos into the batch of the database
+        and queues notifications about the new videos.
+        The videos are looked through less often while the count of videos of the profile doesn't change.
+
+        :param name: unique name of a TikTok profile
+        :param user_dict: the dictionary of the profile received from TikTok
+        :param batch: the WriteBatch object of the database
+        """
+        user = User(user_dict)
+        batch.add_user(user)
+
+        # The history gets a row only when the statistics change
+        stats = (user.followers, user.following, user.heart_count, user.video_count)
+        if self.user_stats.get(name) != stats:
+            self.user_stats[name] = stats
+            batch.add_user_stats(user, datetime.now())
+
+        # A profile polled for the first time gets the watermark, so videos posted while the informer
+        # is stopped will be found after the restart
+        if name not in self.last_timestamps:
+            self.last_timestamps[name] = datetime.now() - timedelta(seconds=self.timeout)
+            batch.add_watermark(name, self.last_timestamps[name])
+
+        # An unchanged count is only a hint, since a deleted and a posted video leave it the same,
+        # so the videos are still looked through once per $scan_polls polls
+        video_count = user.video_count
+        previous_count = self.video_counts.get(name)
+        skipped = self.skipped_scans.get(name, 0)
+        if previous_count == video_count and skipped + 1 < self.scan_polls:
+            self.skipped_scans[name] = skipped + 1
+            return
+        self.skipped_scans[name] = 0
 
-            # Iterate from the last tiktok to the first
-            for item in user_dict['items'][::-1]:
-                tiktok = Tiktok(item)
+        # Pinned videos go before the last ones regardless of their time, so the scan doesn't stop
+        # at the first seen video, but the whole page is filtered by the watermark
+        watermark = self.last_timestamps[name].timestamp()
+        new_items = sorted((item for item in user_dict['items'] if item['createTime'] > watermark),
+                           key=lambda item: item['createTime'])
 
-                if tiktok.time > self.last_timestamps.get(name, datetime.now() - timedelta(seconds=self.timeout)):
-                    # Check whether it's a new video or not
-                    self.database.add_tiktok(tiktok)
-                    self.last_timestamps[name] = tiktok.time
+        # The count can be updated before the new videos appear on the page,
+        # so a grown count is stored only when the new videos are found
+        if new_items or previous_count is None or video_count <= previous_count:
+            self.video_counts[name] = video_count
 
-                    # Send notifications
-                    for chat_id in self.database.get_chats_favourite_users(name):
-                        self.send_notification(chat_id, tiktok)
+        # Iterate from the first new tiktok to the last
+        for item in new_items:
+            tiktok = Tiktok(item)
+            DETECTION_LAG_SECONDS.observe((datetime.now() - tiktok.time).total_seconds())
+            batch.add_tiktok(tiktok)
+            batch.add_watermark(name, tiktok.time)
+            self.last_timestamps[name] = tiktok.time
 
-        time.sleep(self.timeout)
+            # Queue notifications
+            for chat_id in self.subscribers.chats(name):
+                await self.send_notification(chat_id, tiktok)
 
-    def send_notification(self, chat_id: int, tiktok: Tiktok):
+    async def send_notification(self, chat_id: int, tiktok: Tiktok):
         """
-        Method to send notification to a user that a new video was released.
+        Method to queue notification to a user that a new video was released.
+        The notification is sent by the dispatcher.
 
         :param chat_id: the id of a user
         :param tiktok: Tiktok object
@@ -72,6 +374,4 @@ class TikTokInformer:
                f"Описание: {tiktok.desc}.\n\n" \
                f"https://www.tiktok.com/@{tiktok.user_id}/video/{tiktok.id}"
 
-        self.bot.sendMessage(chat_id=chat_id,
-                             text=text,
-                             disable_web_page_preview=True)
+        await self.dispatcher.put(chat_id, text)
@@ -1,32 +1,30 @@
 class User:
+    # Fields are read from the dictionary of the profile when they're accessed
+    __slots__ = ('_user_dict',)
+
     def __init__(self, user_dict: dict):
-        self._unique_id = user_dict['uniqueId']
-        self._nickname = user_dict['userInfo']['user']['nickname']
-        self._followers = user_dict['userInfo']['stats']['followerCount']
-        self._following = user_dict['userInfo']['stats']['followingCount']
-        self._heart_count = user_dict['userInfo']['stats']['heartCount']
-        self._video_count = user_dict['userInfo']['stats']['videoCount']
+        self._user_dict = user_dict
 
     @property
     def unique_id(self):
-        return self._unique_id
+        return self._user_dict['uniqueId']
 
     @property
     def nickname(self):
-        return self._nickname
+        return self._user_dict['userInfo']['user']['nickname']
 
     @property
     def followers(self):
-        return self._followers
+        return self._user_dict['userInfo']['stats']['followerCount']
 
     @property
     def following(self):
-        return self._following
+        return self._user_dict['userInfo']['stats']['followingCount']
 
     @property
     def heart_count(self):
-        return self._heart_count
+        return self._user_dict['userInfo']['stats']['heartCount']
 
     @property
     def video_count(self):
-        return self._video_count
+        return self._user_dict['userInfo']['stats']['videoCount']
@@ -1,7 +1,15 @@
 import os
 import asyncio
 from informer.tiktokinformer import TikTokInformer
-from database.db import Database
+from informer.supervisor import Supervisor
+from informer.scheduler import PollScheduler
+from informer.dispatcher import NotificationDispatcher
+from informer.profiles import ProfileCache
+from informer.fetchers import get_fetcher
+from informer.sessions import SessionPool
+from informer.governor import Governor
+from informer import metrics
+from database.db import Database, WriteBatch
 from telegram.ext import Updater
 
 
@@ -10,19 +18,89 @@ PG_PORT = os.getenv('PG_PORT')
 PG_NAME = os.getenv('PG_NAME')
 PG_USER = os.getenv('PG_USER')
 PG_PASS = os.getenv('PG_PASS')
+# Bounds of the pool of connections to the database
+PG_MIN_CONNECTIONS = int(os.getenv('PG_MIN_CONNECTIONS', 1))
+PG_MAX_CONNECTIONS = int(os.getenv('PG_MAX_CONNECTIONS', 4))
 TOKEN = os.getenv('TOKEN')
+# The backend requesting TikTok profiles: selenium, selenium-pool, http or fake
+FETCH_BACKEND = os.getenv('FETCH_BACKEND', 'selenium')
+# Count of browser sessions of the selenium-pool backend, count of requests and resident memory in megabytes
+# after which a session is recycled
+BROWSER_SESSIONS = int(os.getenv('BROWSER_SESSIONS', SessionPool.size))
+SESSION_MAX_REQUESTS = int(os.getenv('SESSION_MAX_REQUESTS', SessionPool.max_requests))
+SESSION_MAX_RSS = int(os.getenv('SESSION_MAX_RSS', SessionPool.max_rss // 1024 ** 2))
+# The ceiling of the rate of requests to TikTok per second shared by the bot and the informer, 0 disables the limit,
+# the part of it reserved for the bot, and maximum count of requests at the same time
+FETCH_MAX_RATE = float(os.getenv('FETCH_MAX_RATE', Governor.max_rate))
+BOT_FETCH_MAX_RATE = float(os.getenv('BOT_FETCH_MAX_RATE', Governor.rate))
+FETCH_MAX_CONCURRENCY = int(os.getenv('FETCH_MAX_CONCURRENCY', Governor.max_concurrency))
+# Count of profiles which are fetched at the same time
+FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', TikTokInformer.concurrency))
+# Maximum count of profiles polled at once, it's split between the priority lanes
+SWEEP_SIZE = int(os.getenv('SWEEP_SIZE', TikTokInformer.sweep_size))
+# Count of informer processes, each of them polls its own part of the favourite users
+WORKERS = int(os.getenv('WORKERS', 1))
+# Bounds of the interval between two polls of a profile in seconds
+MIN_POLL_INTERVAL = float(os.getenv('MIN_POLL_INTERVAL', PollScheduler.min_interval))
+MAX_POLL_INTERVAL = float(os.getenv('MAX_POLL_INTERVAL', PollScheduler.max_interval))
+# Count of rows and time in seconds after which collected rows are written into the database
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', WriteBatch.size))
+BATCH_WINDOW = float(os.getenv('BATCH_WINDOW', WriteBatch.window))
+# Count of notifications sent at the same time
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', NotificationDispatcher.workers))
+# Time in seconds which existing and missing TikTok profiles are cached for
+PROFILES_TTL = float(os.getenv('PROFILES_TTL', ProfileCache.ttl))
+MISSING_PROFILES_TTL = float(os.getenv('MISSING_PROFILES_TTL', ProfileCache.missing_ttl))
+# Interval in seconds between creations of the next partitions and rollups of the history of statistics
+# of the profiles, 0 disables them
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', TikTokInformer.maintenance_interval))
+# The port of the HTTP server of the metrics, 0 disables it. Each of several workers uses the next ports
+METRICS_PORT = int(os.getenv('METRICS_PORT', 8000))
+
+
+CREDENTIALS = dict(host=PG_HOST, port=PG_PORT,
+                   user=PG_USER, password=PG_PASS,
+                   database=PG_NAME,
+                   min_connections=PG_MIN_CONNECTIONS,
+                   max_connections=PG_MAX_CONNECTIONS)
+FETCH_OPTIONS = dict(size=BROWSER_SESSIONS,
+                     max_requests=SESSION_MAX_REQUESTS,
+                     max_rss=SESSION_MAX_RSS * 1024 ** 2) if FETCH_BACKEND == 'selenium-pool' else {}
+if FETCH_MAX_RATE:
+    if FETCH_MAX_RATE <= BOT_FETCH_MAX_RATE:
+        raise ValueError("FETCH_MAX_RATE must be greater than the part of the bot BOT_FETCH_MAX_RATE")
+    # The rest of the ceiling after the part of the bot is shared by the workers
+    FETCH_OPTIONS['governor'] = dict(max_rate=(FETCH_MAX_RATE - BOT_FETCH_MAX_RATE) / WORKERS,
+                                     max_concurrency=FETCH_MAX_CONCURRENCY)
+INFORMER_PARAMETERS = dict(concurrency=FETCH_CONCURRENCY,
+                           sweep_size=SWEEP_SIZE,
+                           min_interval=MIN_POLL_INTERVAL,
+                           max_interval=MAX_POLL_INTERVAL,
+                           batch_size=BATCH_SIZE,
+                           batch_window=BATCH_WINDOW,
+                           notification_workers=NOTIFICATION_WORKERS,
+                           profiles_ttl=PROFILES_TTL,
+                           missing_profiles_ttl=MISSING_PROFILES_TTL,
+                           maintenance_interval=MAINTENANCE_INTERVAL)
 
 
 async def main():
-    informer_db = Database.connect(host=PG_HOST, port=PG_PORT,
-                                   user=PG_USER, password=PG_PASS,
-                                   database=PG_NAME)
+    metrics.start(METRICS_PORT)
+    informer_db = Database.connect(**CREDENTIALS)
 
     updater = Updater(token=TOKEN)
-    informer = TikTokInformer(database=informer_db, bot=updater.bot)
+    fetcher = get_fetcher(FETCH_BACKEND, **FETCH_OPTIONS)
+    informer = TikTokInformer(database=informer_db, bot=updater.bot, fetcher=fetcher, **INFORMER_PARAMETERS)
     await informer.run()
 
 
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    if WORKERS > 1:
+        supervisor = Supervisor(workers=WORKERS, credentials=CREDENTIALS,
+                                token=TOKEN, backend=FETCH_BACKEND, fetch_options=FETCH_OPTIONS,
+                                metrics_port=METRICS_PORT,
+                                **INFORMER_PARAMETERS)
+        supervisor.run()
+    else:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(main())
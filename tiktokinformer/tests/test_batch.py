@@ -0,0 +1,112 @@
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+pytest.importorskip('prometheus_client')
+
+from database.db import WriteBatch
+
+
+class FakeCursor:
+    """
+    Cursor which renders the values instead of quoting them and fails the statements containing 'bad'.
+    """
+    connection = SimpleNamespace(encoding='UTF8')
+
+    def __init__(self):
+        self.statements = []
+
+    def mogrify(self, template, args):
+        return repr(tuple(args)).encode()
+
+    def execute(self, statement, parameters=None):
+        if isinstance(statement, bytes):
+            if b'bad' in statement:
+                raise psycopg2.DataError('bad row')
+            self.statements.append(statement)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.written = []
+        self.transactions = 0
+        self.error = None
+
+    @contextmanager
+    def transaction(self):
+        if self.error is not None:
+            raise self.error
+        self.transactions += 1
+        cur = FakeCursor()
+        yield cur
+        self.written.extend(cur.statements)
+
+    def contains(self, value: str) -> bool:
+        return any(value.encode() in statement for statement in self.written)
+
+
+def tiktok(id: int, desc: str):
+    return SimpleNamespace(id=id, user_id='alice', desc=desc, time=datetime(2021, 1, 1))
+
+
+def test_rows_are_written_in_one_transaction():
+    database = FakeDatabase()
+    with WriteBatch(database) as batch:
+        batch.add_tiktok(tiktok(1, 'first'))
+        batch.add_tiktok(tiktok(2, 'second'))
+        batch.add_watermark('alice', datetime(2021, 1, 1))
+
+    assert database.transactions == 1
+    # One statement per table
+    assert len(database.written) == 2
+    assert database.contains('first') and database.contains('second')
+    assert len(batch) == 0
+
+
+def test_bad_row_doesnt_discard_others():
+    database = FakeDatabase()
+    with WriteBatch(database) as batch:
+        batch.add_tiktok(tiktok(1, 'first'))
+        batch.add_tiktok(tiktok(2, 'bad'))
+        batch.add_tiktok(tiktok(3, 'third'))
+
+    assert database.contains('first') and database.contains('third')
+    assert not database.contains('bad')
+    # The rows are written one by one
+    assert len(database.written) == 2
+
+
+def test_rows_are_kept_while_database_is_unavailable():
+    database = FakeDatabase()
+    database.error = psycopg2.OperationalError("Connection to the database couldn't be restored")
+    batch = WriteBatch(database, window=60)
+    batch.add_tiktok(tiktok(1, 'first'))
+    batch.add_watermark('alice', datetime(2021, 1, 1))
+
+    batch.flush()
+    assert len(batch) == 2
+
+    # The rows collected after the failure are newer than the restored ones
+    batch.add_tiktok(tiktok(1, 'edited'))
+    batch.add_watermark('alice', datetime(2021, 1, 2))
+    assert len(batch) == 2
+
+    database.error = None
+    batch.flush()
+    assert database.contains('edited')
+    assert not database.contains('first')
+    assert len(batch) == 0
+
+
+def test_failed_batch_isnt_retried_before_window():
+    database = FakeDatabase()
+    database.error = psycopg2.OperationalError('server closed the connection')
+    batch = WriteBatch(database, size=1, window=60)
+    batch.add_tiktok(tiktok(1, 'first'))
+
+    database.error = None
+    batch.add_tiktok(tiktok(2, 'second'))
+    assert database.transactions == 0
+    assert len(batch) == 2
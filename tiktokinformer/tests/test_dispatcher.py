@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('prometheus_client')
+
+from telegram.error import BadRequest, NetworkError, Unauthorized
+from informer.dispatcher import NotificationDispatcher, TokenBucket
+
+
+class FailingBot:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def sendMessage(self, chat_id: int, text: str, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def test_bucket_gives_its_capacity_at_once():
+    bucket = TokenBucket(rate=1, capacity=3)
+
+    async def take():
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(asyncio.wait_for(take(), timeout=0.5))
+    assert not bucket.full
+
+
+def test_bucket_waits_for_tokens():
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    async def take():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire()
+        await bucket.acquire()
+        return loop.time() - started
+
+    assert asyncio.run(take()) >= 0.04
+
+
+def test_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    asyncio.run(bucket.acquire())
+    # The bucket is refilled as if a minute passed
+    bucket._updated -= 60
+
+    assert bucket.full
+    assert bucket._tokens == 2
+
+
+
+@pytest.mark.parametrize('error', [BadRequest('Chat not found'), Unauthorized('Forbidden: bot was blocked by the user')])
+def test_rejected_notification_isnt_retried(error):
+    bot = FailingBot(error)
+    dispatcher = NotificationDispatcher(bot, workers=1)
+
+    asyncio.run(asyncio.wait_for(dispatcher._send(1, 'text'), timeout=1))
+    assert bot.calls == 1
+
+
+def test_network_error_is_retried(monkeypatch):
+    bot = FailingBot(NetworkError('Connection reset'))
+    dispatcher = NotificationDispatcher(bot, workers=1)
+
+    async def sleep(delay):
+        pass
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    asyncio.run(dispatcher._send(1, 'text'))
+    assert bot.calls == 2
@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('TikTokApi')
+
+from informer.fetchers import FakeFetcher, ProfileNotFoundError, get_fetcher
+
+
+def test_profiles_are_taken_from_dictionary():
+    fetcher = FakeFetcher(profiles={'alice': {'uniqueId': 'alice', 'items': []}})
+
+    assert fetcher.get_user('alice')['uniqueId'] == 'alice'
+    assert fetcher.exists('alice')
+    assert not fetcher.exists('bob')
+
+
+def test_profiles_are_taken_from_directory(tmp_path):
+    (tmp_path / 'alice.json').write_text(json.dumps({'uniqueId': 'alice', 'items': []}), encoding='utf-8')
+    fetcher = FakeFetcher(directory=str(tmp_path))
+
+    assert fetcher.get_user('alice')['uniqueId'] == 'alice'
+    with pytest.raises(ProfileNotFoundError):
+        fetcher.get_user('bob')
+
+
+def test_missing_profile_isnt_failure():
+    fetcher = FakeFetcher()
+    with pytest.raises(ProfileNotFoundError):
+        fetcher.get_user('alice')
+
+    stats = fetcher.stats()
+    assert stats['requests'] == 1
+    assert stats['failures'] == 0
+
+
+def test_backend_is_chosen_by_name():
+    fetcher = get_fetcher('fake', governor=dict(max_rate=5), profiles={})
+
+    assert isinstance(fetcher, FakeFetcher)
+    assert fetcher.governor.max_rate == 5
+    assert 'governor_rate' in fetcher.stats()
+    with pytest.raises(ValueError):
+        get_fetcher('carrier-pigeon')
+
+
+class SlowFetcher(FakeFetcher):
+    concurrency = 1
+
+    def _get_user(self, username: str) -> dict:
+        time.sleep(0.1)
+        return super(SlowFetcher, self)._get_user(username)
+
+
+class RecordingGovernor:
+    def __init__(self):
+        self.seconds = []
+
+    def acquire(self):
+        pass
+
+    def release(self, healthy: bool, seconds: float):
+        self.seconds.append(seconds)
+
+
+def test_waiting_for_backend_isnt_timed():
+    fetcher = SlowFetcher(profiles={'alice': {'uniqueId': 'alice', 'items': []}})
+    fetcher.governor = RecordingGovernor()
+
+    threads = [threading.Thread(target=fetcher.get_user, args=('alice',)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetcher.governor.seconds) == 3
+    # The requests are made one at a time, but each of them is timed by itself
+    assert max(fetcher.governor.seconds) < 0.18
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+import pytest
+from informer import governor
+from informer.governor import Governor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(governor, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_healthy_responses_raise_limits(clock):
+    limits = Governor(max_rate=1.5, max_concurrency=2)
+
+    for _ in range(10):
+        limits.acquire()
+        limits.release(True, 0.1)
+        clock.now += 1
+
+    assert limits.rate == 1.5
+    assert limits.concurrency == 2
+
+
+def test_failures_lower_limits_once_per_cooldown(clock):
+    limits = Governor(max_rate=10)
+    limits.rate = 8
+    limits.concurrency = 4
+
+    limits.acquire()
+    limits.release(False, 0.1)
+    assert limits.rate == 4
+    assert limits.concurrency == 2
+
+    # The requests sent at the same rate fail together, so they decrease the limits once
+    clock.now += 1
+    limits.acquire()
+    limits.release(False, 0.1)
+    assert limits.rate == 4
+
+    clock.now += limits.cooldown
+    limits.acquire()
+    limits.release(False, 0.1)
+    assert limits.rate == 2
+
+
+def test_slow_responses_lower_limits(clock):
+    limits = Governor()
+    limits.acquire()
+    limits.release(True, limits.slow + 1)
+
+    assert limits.rate == Governor.rate * limits.decrease
+
+
+def test_rate_doesnt_fall_below_minimum(clock):
+    limits = Governor()
+    for _ in range(10):
+        clock.now += limits.cooldown
+        limits.acquire()
+        limits.release(False, 0.1)
+
+    assert limits.rate == limits.min_rate
+    assert limits.concurrency == 1
+
+
+def test_share_below_minimum_rate_is_honored(clock):
+    limits = Governor(max_rate=0.1)
+
+    assert limits.rate == 0.1
+    assert limits.min_rate == 0.1
+
+
+def test_stats(clock):
+    limits = Governor()
+    limits.acquire()
+
+    assert limits.stats() == {'rate': Governor.rate, 'concurrency': 1, 'in_flight': 1}
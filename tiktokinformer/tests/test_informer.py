@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('prometheus_client')
+pytest.importorskip('telegram')
+pytest.importorskip('requests')
+pytest.importorskip('TikTokApi')
+
+from informer.tiktokinformer import TikTokInformer
+from informer.fetchers import FakeFetcher
+
+
+class RecordingBatch:
+    def __init__(self):
+        self.users = []
+        self.stats = []
+        self.tiktoks = []
+        self.watermarks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def add_user(self, user):
+        self.users.append(user.unique_id)
+
+    def add_user_stats(self, user, timestamp):
+        self.stats.append(user.unique_id)
+
+    def add_tiktok(self, tiktok):
+        self.tiktoks.append(tiktok.id)
+
+    def add_watermark(self, unique_id, timestamp):
+        self.watermarks.append((unique_id, timestamp))
+
+
+class FakeDatabase:
+    def batch(self, size=None, window=None):
+        return RecordingBatch()
+
+
+def profile(name: str, videos: int, items: list) -> dict:
+    return {'uniqueId': name,
+            'userInfo': {'user': {'nickname': name},
+                         'stats': {'followerCount': 10, 'followingCount': 1, 'heartCount': 100, 'videoCount': videos}},
+            'items': items}
+
+
+def video(name: str, id: str, created: int, **fields) -> dict:
+    return dict(id=id, desc=f'video {id}', createTime=created, author={'uniqueId': name}, **fields)
+
+
+@pytest.fixture
+def informer():
+    informer = TikTokInformer(FakeDatabase(), bot=None, fetcher=FakeFetcher())
+    informer.notifications = []
+
+    async def send_notification(chat_id, tiktok):
+        informer.notifications.append((chat_id, tiktok.id))
+
+    informer.send_notification = send_notification
+    informer.last_timestamps['alice'] = datetime.fromtimestamp(1000)
+    informer.subscribers.add('alice', 42)
+    yield informer
+    informer.executor.shutdown()
+
+
+def process(informer, user_dict) -> RecordingBatch:
+    batch = RecordingBatch()
+    asyncio.run(informer._process_profile(user_dict['uniqueId'], user_dict, batch))
+    return batch
+
+
+def test_new_videos_are_found_behind_pinned_one(informer):
+    items = [video('alice', 'pinned', 500, isPinned=True),
+             video('alice', 'second', 1200),
+             video('alice', 'first', 1100),
+             video('alice', 'old', 900)]
+
+    batch = process(informer, profile('alice', 4, items))
+
+    assert batch.tiktoks == ['first', 'second']
+    assert informer.notifications == [(42, 'first'), (42, 'second')]
+    assert informer.last_timestamps['alice'] == datetime.fromtimestamp(1200)
+    assert informer.video_counts['alice'] == 4
+
+
+def test_grown_count_is_stored_when_videos_appear(informer):
+    informer.video_counts['alice'] = 1
+    items = [video('alice', 'old', 900)]
+
+    # The count is updated before the video appears on the page
+    process(informer, profile('alice', 2, items))
+    assert informer.video_counts['alice'] == 1
+
+    batch = process(informer, profile('alice', 2, [video('alice', 'new', 1100)] + items))
+    assert batch.tiktoks == ['new']
+    assert informer.video_counts['alice'] == 2
+
+
+def test_unchanged_count_still_gets_scanned(informer):
+    informer.scan_polls = 2
+    informer.video_counts['alice'] = 1
+    # A video was deleted and another one was posted
+    user_dict = profile('alice', 1, [video('alice', 'new', 1100)])
+
+    assert process(informer, user_dict).tiktoks == []
+    assert process(informer, user_dict).tiktoks == ['new']
+
+
+def test_profiles_are_loaded_through_fetcher(informer):
+    informer.fetcher.profiles['alice'] = profile('alice', 1, [video('alice', 'new', 1100)])
+    informer.batch = RecordingBatch()
+
+    asyncio.run(informer._load_profiles(['alice', 'missing']))
+
+    assert informer.batch.users == ['alice']
+    assert informer.batch.tiktoks == ['new']
+    assert informer.profiles.missing('missing')
+    assert informer.fetcher.stats()['requests'] == 2
+
+
+def test_statistics_are_stored_when_changed(informer):
+    user_dict = profile('alice', 1, [])
+
+    assert process(informer, user_dict).stats == ['alice']
+    assert process(informer, user_dict).stats == []
+
+
+def test_fetches_dont_exceed_concurrency_of_backend():
+    fetcher = FakeFetcher()
+    fetcher.concurrency = 1
+
+    assert TikTokInformer(FakeDatabase(), bot=None, fetcher=fetcher, concurrency=8).concurrency == 1
+    assert TikTokInformer(FakeDatabase(), bot=None, fetcher=FakeFetcher(), concurrency=8).concurrency == 8
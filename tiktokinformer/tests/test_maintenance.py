@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from informer import maintenance
+from informer.maintenance import Maintenance
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.calls = []
+
+    def create_partitions(self):
+        self.calls.append('create_partitions')
+
+    def rollup_user_stats(self):
+        self.calls.append('rollup_user_stats')
+        return 0
+
+    def migrate_tiktoks(self):
+        self.calls.append('migrate_tiktoks')
+        raise RuntimeError('tiktoks is locked')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(maintenance, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_database_is_maintained_once_per_interval(clock):
+    database = FakeDatabase()
+    runner = Maintenance(database, interval=60)
+
+    runner.run()
+    clock.now += 30
+    runner.run()
+    assert database.calls == ['create_partitions', 'rollup_user_stats']
+
+    clock.now += 30
+    runner.run()
+    assert len(database.calls) == 4
+
+
+def test_maintenance_is_disabled_without_interval(clock):
+    database = FakeDatabase()
+    Maintenance(database, interval=None).run()
+
+    assert database.calls == []
+
+
+def test_failed_migration_isnt_raised():
+    database = FakeDatabase()
+    Maintenance(database).migrate()
+
+    assert database.calls == ['migrate_tiktoks']
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+import pytest
+from informer import scheduler
+from informer.scheduler import PollScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(scheduler, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_interval_is_bounded():
+    polls = PollScheduler(min_interval=60, max_interval=3600)
+
+    assert polls.interval(0, 100) == 3600
+    assert polls.interval(100000, 100) == 60
+    assert polls.interval(140, 1000) < polls.interval(140, 0)
+
+
+def test_lanes_by_subscribers():
+    polls = PollScheduler()
+
+    assert polls.lane(5000) == 0
+    assert polls.lane(50) == 1
+    assert polls.lane(0) == 2
+
+
+def test_new_profiles_are_due_immediately(clock):
+    polls = PollScheduler()
+    polls.add('alice')
+    polls.add('bob')
+
+    assert sorted(polls.pop_due()) == ['alice', 'bob']
+    assert polls.delay() == polls.max_interval
+
+
+def test_polled_profile_isnt_due_until_rescheduled(clock):
+    polls = PollScheduler(min_interval=60, max_interval=3600)
+    polls.add('alice')
+
+    assert polls.pop_due() == ['alice']
+    # The count of subscribers changes while the profile is being polled
+    polls.set_subscribers('alice', 5000)
+    assert polls.pop_due() == []
+
+    polls.reschedule('alice')
+    assert polls.pop_due() == []
+    clock.now += 3600
+    assert polls.pop_due() == ['alice']
+
+
+def test_update_synchronizes_profiles(clock):
+    polls = PollScheduler()
+    polls.add('alice')
+    polls.add('bob')
+
+    polls.update(['bob', 'carol'], videos={'bob': 100}, subscribers={'carol': 1000})
+
+    assert 'alice' not in polls
+    assert len(polls) == 2
+    assert polls.lane_sizes() == [1, 0, 1]
+    assert sorted(polls.pop_due()) == ['bob', 'carol']
+
+
+def test_removed_profile_isnt_due(clock):
+    polls = PollScheduler()
+    polls.add('alice')
+    polls.remove('alice')
+
+    assert polls.pop_due() == []
+    assert len(polls) == 0
+
+
+def test_sweep_is_split_between_lanes(clock):
+    polls = PollScheduler()
+    for index in range(10):
+        polls.add(f'top{index}', subscribers=1000)
+        polls.add(f'middle{index}', subscribers=50)
+        polls.add(f'tail{index}', subscribers=0)
+
+    names = polls.pop_due(10)
+
+    assert len(names) == 10
+    assert sum(name.startswith('top') for name in names) == 5
+    assert sum(name.startswith('middle') for name in names) == 3
+    assert sum(name.startswith('tail') for name in names) == 2
+
+
+def test_unused_share_is_given_to_other_lanes(clock):
+    polls = PollScheduler()
+    polls.add('top', subscribers=1000)
+    for index in range(10):
+        polls.add(f'tail{index}', subscribers=0)
+
+    names = polls.pop_due(10)
+
+    assert len(names) == 10
+    assert 'top' in names
+
+
+def test_update_keeps_lanes_of_scheduled_profiles(clock):
+    polls = PollScheduler()
+    polls.add('alice', subscribers=1000)
+
+    polls.update(['alice'], videos={'alice': 100})
+    assert polls.lane_sizes() == [1, 0, 0]
+
+    polls.set_subscribers('alice', 10)
+    assert polls.lane_sizes() == [0, 0, 1]
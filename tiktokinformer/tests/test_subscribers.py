@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from informer import subscribers
+from informer.subscribers import ChangesCursor, SubscriberIndex
+
+
+class ChangesLog:
+    def __init__(self):
+        self.changes = {}
+
+    def commit(self, seq: int, unique_id: str, chat_id: int, deleted: bool = False):
+        self.changes[seq] = (seq, unique_id, chat_id, deleted)
+
+    def get_subscriptions_changes(self, cursor: int, gaps: list = ()) -> list:
+        return [self.changes[seq] for seq in sorted(self.changes) if seq > cursor or seq in gaps]
+
+
+def test_build_sorts_chats():
+    index = SubscriberIndex()
+    index.build([('alice', 3), ('alice', 1), ('bob', 2), ('alice', 2)])
+
+    assert list(index.chats('alice')) == [1, 2, 3]
+    assert list(index.chats('bob')) == [2]
+    assert len(index) == 4
+    assert index.counts() == {'alice': 3, 'bob': 1}
+
+
+def test_add_and_discard():
+    index = SubscriberIndex()
+
+    assert index.add('alice', 2)
+    assert index.add('alice', 1)
+    assert not index.add('alice', 2)
+    assert list(index.chats('alice')) == [1, 2]
+
+    assert index.discard('alice', 1)
+    assert not index.discard('alice', 1)
+    assert not index.discard('bob', 1)
+    assert index.discard('alice', 2)
+    assert 'alice' not in index
+    assert index.chats('alice') == ()
+
+
+def test_build_replaces_content():
+    index = SubscriberIndex()
+    index.add('alice', 1)
+    index.build([('bob', 1)])
+
+    assert list(index) == ['bob']
+
+
+def test_changes_committed_out_of_order_are_read(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(subscribers, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    log = ChangesLog()
+    cursor = ChangesCursor(seq=1)
+
+    log.commit(2, 'alice', 1)
+    log.commit(5, 'bob', 1)
+    assert [change[0] for change in cursor.read(log)] == [2, 5]
+    assert cursor.seq == 5
+    assert set(cursor.gaps) == {3, 4}
+
+    # The transaction which allocated the third number is committed later, the fourth one is rolled back
+    log.commit(3, 'carol', 2)
+    log.commit(6, 'dave', 3)
+    assert [change[0] for change in cursor.read(log)] == [3, 6]
+    assert set(cursor.gaps) == {4}
+    assert cursor.read(log) == []
+
+    clock.now += cursor.gap_lifetime
+    cursor.read(log)
+    assert cursor.gaps == {}
+
+
+def test_reset_forgets_gaps():
+    log = ChangesLog()
+    log.commit(3, 'alice', 1)
+    cursor = ChangesCursor()
+    cursor.read(log)
+
+    cursor.reset(10)
+    assert cursor.seq == 10
+    assert cursor.gaps == {}
+    assert cursor.read(log) == []
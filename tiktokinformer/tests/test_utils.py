@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('psycopg2')
+pytest.importorskip('prometheus_client')
+
+from utils import parse_page
+
+PAGE = """
+<table>
+  <tr><th>#</th><th>Name</th></tr>
+  <tr><td class="rank">1</td><td class="name"><a name="alice" href="/alice">Alice</a></td></tr>
+  <tr><td class="rank">2</td><td class="user name"><a name="bob" href="/bob">Bob</a><a name="ignored"></a></td></tr>
+  <tr><td class="rank"><a name="not_a_name"></a></td><td class="name"><a name="carol" href="/carol">Carol</a></td></tr>
+</table>
+"""
+
+
+def test_names_in_order():
+    assert parse_page([PAGE]) == ['alice', 'bob', 'carol']
+
+
+def test_page_split_inside_tags():
+    chunks = [PAGE[index:index + 7] for index in range(0, len(PAGE), 7)]
+
+    assert parse_page(chunks) == ['alice', 'bob', 'carol']
+
+
+def test_rest_of_page_is_skipped_after_limit():
+    read = []
+
+    def chunks():
+        for line in PAGE.splitlines(keepends=True):
+            read.append(line)
+            yield line
+
+    assert parse_page(chunks(), limit=2) == ['alice', 'bob']
+    assert len(read) < len(PAGE.splitlines())
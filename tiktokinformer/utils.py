@@ -1,34 +1,190 @@
+import argparse
+import json
+import os
+import time
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+from database.db import Database
 
+# The ref to the service
+TOP_USERS_URL = 'https://www.t30p.ru/TikTok.aspx?p={}&order=0'
+# Count of users on each page
+COUNT_ON_PAGE = 100
 
-def get_top_users(count: int) -> list:
+
+def get_session(pool_size: int) -> requests.Session:
     """
-    Function returns names of the first $count TikTok profiles sorted by the count of subscribers
+    Function creates a session which keeps $pool_size connections open to reuse them between requests.
 
-    :param count: the count of top profiles
+    :param pool_size: count of connections
+    :return: the Session object
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_page(session: requests.Session, page: int, cache_dir: str = None, ttl: float = 3600) -> str:
+    """
+    Function returns the text of a page of the ranking. If $cache_dir is passed, the page is kept there:
+    it's returned without a request during $ttl seconds, and after that it's revalidated by a conditional request.
+
+    :param session: the Session object
+    :param page: the number of a page
+    :param cache_dir: the directory of the cache
+    :param ttl: time in seconds which the cached page is fresh for
+    :return: the text of the page
+    """
+    cached, meta = None, {}
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f'{page}.html')
+        meta_path = os.path.join(cache_dir, f'{page}.json')
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as file:
+                meta = json.load(file)
+            with open(path, encoding='utf-8') as file:
+                cached = file.read()
+            if time.time() - meta['fetched'] < ttl:
+                return cached
+
+    headers = {}
+    if cached is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    response = session.get(TOP_USERS_URL.format(page), headers=headers)
+    if response.status_code == 304 and cached is not None:
+        text = cached
+    elif response.status_code == 200:
+        text = response.text
+        meta = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    else:
+        raise requests.ConnectionError('Getting response from the site was failed')
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        if text is not cached:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(text)
+        meta['fetched'] = time.time()
+        with open(meta_path, 'w') as file:
+            json.dump(meta, file)
+    return text
+
+
+class RankingParser(HTMLParser):
+    """
+    Parser collecting names of the profiles from a page of the ranking while the page is fed to it in parts.
+    The name of a profile is the name attribute of the first link in a cell of the "name" class.
+    """
+    class Enough(Exception):
+        pass
+
+    def __init__(self, limit: int = None):
+        """
+        :param limit: count of names after which the parsing is stopped
+        """
+        super(RankingParser, self).__init__()
+        self.limit = limit
+        self.names = []
+        self._in_name = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'td':
+            self._in_name = 'name' in (dict(attrs).get('class') or '').split()
+        elif tag == 'a' and self._in_name:
+            self._in_name = False
+            self.names.append(dict(attrs).get('name'))
+            if self.limit is not None and len(self.names) >= self.limit:
+                raise self.Enough
+
+    def handle_endtag(self, tag):
+        if tag == 'td':
+            self._in_name = False
+
+
+def parse_page(chunks, limit: int = None) -> list:
+    """
+    Function returns names of the profiles from a page of the ranking in their order.
+    The page is parsed while its parts are received and the rest of it is skipped as soon as $limit names are found.
+
+    :param chunks: iterable of parts of the text of a page
+    :param limit: count of names to find, all of them are found if it's None
     :return: list of names
     """
-    names = []
-    # Count of users on each page
-    count_on_page = 100
+    parser = RankingParser(limit)
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+    except RankingParser.Enough:
+        pass
+    return parser.names
 
-    # Get count of pages
-    page = (count - 1) // count_on_page + 1
-    for page in range(1, page+1):
-        # The ref to the service
-        ref = 'https://www.t30p.ru/TikTok.aspx?p={}&order=0'
 
-        response = requests.get(ref.format(page))
+def get_page_names(session: requests.Session, page: int, limit: int, cache_dir: str = None, ttl: float = 3600) -> list:
+    """
+    Function returns names of the profiles from a page of the ranking. If the page isn't cached,
+    it's parsed while it's downloaded and the download is stopped as soon as $limit names are found.
+
+    :param session: the Session object
+    :param page: the number of a page
+    :param limit: count of names to find
+    :param cache_dir: the directory of the cache, the page isn't cached if it's None
+    :param ttl: time in seconds which the cached page is fresh for
+    :return: list of names
+    """
+    if cache_dir is not None:
+        return parse_page([get_page(session, page, cache_dir, ttl)], limit)
+
+    with session.get(TOP_USERS_URL.format(page), stream=True) as response:
         if response.status_code != 200:
             raise requests.ConnectionError('Getting response from the site was failed')
+        if response.encoding is None:
+            response.encoding = 'utf-8'
+        return parse_page(response.iter_content(chunk_size=8192, decode_unicode=True), limit)
+
+
+def get_top_users(count: int, workers: int = 8, cache_dir: str = None, ttl: float = 3600) -> list:
+    """
+    Function returns names of the first $count TikTok profiles sorted by the count of subscribers.
+    The pages of the ranking are requested concurrently over one session and parsed while they're received.
+
+    :param count: the count of top profiles
+    :param workers: count of pages requested at the same time
+    :param cache_dir: the directory which the pages are cached in, they aren't cached if it's None
+    :param ttl: time in seconds which the cached pages are fresh for
+    :return: list of names
+    """
+    # Get count of pages
+    pages = (count - 1) // COUNT_ON_PAGE + 1
+
+    # The last page is parsed only until the rest of the profiles is found
+    limits = [min(COUNT_ON_PAGE, count - (page - 1) * COUNT_ON_PAGE) for page in range(1, pages + 1)]
+
+    names = []
+    with get_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        for page_names in executor.map(lambda page, limit: get_page_names(session, page, limit, cache_dir, ttl),
+                                       range(1, pages + 1), limits):
+            names.extend(page_names)
+    return names[:count]
+
+
+def seed_top_users(database: Database, count: int, **kwargs) -> int:
+    """
+    Function adds the first $count TikTok profiles into the profiles polled by the informer in one transaction.
 
-        bs = BeautifulSoup(response.text, features='html.parser')
-        for profile in bs.find_all('td', class_='name'):
-            if len(names) == count:
-                return names
-            names.append(profile.find('a').get('name'))
-    return names
+    :param database: the Database object
+    :param count: the count of top profiles
+    :param kwargs: the keyword arguments of get_top_users
+    :return: count of the added profiles
+    """
+    return database.add_seed_users(get_top_users(count, **kwargs))
 
 
 def get_sublists(main_list: list, count: int):
@@ -61,3 +217,20 @@ def get_sublists(main_list: list, count: int):
         sublists = [main_list[x:x + 1] for x in range(0, len(main_list))]
 
     return sublists
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Adds the top TikTok profiles into the profiles polled by the informer')
+    parser.add_argument('count', type=int, help='the count of top profiles')
+    parser.add_argument('--workers', type=int, default=8, help='count of pages requested at the same time')
+    parser.add_argument('--cache-dir', help='the directory which the pages are cached in')
+    parser.add_argument('--ttl', type=float, default=3600, help='time in seconds which the cached pages are fresh for')
+    args = parser.parse_args()
+
+    db = Database.connect(host=os.getenv('PG_HOST'), port=os.getenv('PG_PORT'),
+                          user=os.getenv('PG_USER'), password=os.getenv('PG_PASS'),
+                          database=os.getenv('PG_NAME'))
+    started = time.perf_counter()
+    added = seed_top_users(db, args.count, workers=args.workers, cache_dir=args.cache_dir, ttl=args.ttl)
+    print(f'{added} profiles were added in {time.perf_counter() - started:.1f} seconds')
+    db.close()